@@ -0,0 +1,236 @@
+"""End-to-end deploy benchmarks against the local Thingiverse stand-in.
+
+    python benchmarks/bench_deploy.py
+    python benchmarks/bench_deploy.py --scenario files-100 --json baseline.json
+    python benchmarks/bench_deploy.py --baseline baseline.json
+
+Every scenario generates a project, starts a fresh threedeploy.mockserver
+process and deploys the project twice: "create" uploads everything, "noop"
+redeploys it unchanged. Each run reports wall time, the number of requests
+and the peak of Python allocations traced by tracemalloc.
+
+With --baseline, the results are compared to an earlier --json output and
+the script exits with 1 if a run got slower than --tolerance allows, sent
+more requests or used more than --tolerance additional memory.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+from threedeploy import threedeploy
+
+# threedeploy imports these on first use, load them up front so the traced
+# peak only covers the deployment
+import asyncio  # noqa: F401
+import requests  # noqa: F401
+
+
+# name: (model files, bytes per model file, images, bytes per image)
+SCENARIOS = {
+    "files-10":  (10,  256 * 1024,       2, 512 * 1024),
+    "files-100": (100, 32 * 1024,        5, 256 * 1024),
+    "files-500": (500, 4 * 1024,         5, 256 * 1024),
+    "large":     (4,   64 * 1024 * 1024, 1, 512 * 1024),
+}
+
+BENCHMARK_CREATOR = "benchmark"
+WRITE_CHUNK_SIZE = 1024 * 1024
+# Runs this short jitter more than the tolerance allows
+TIME_SLACK = 0.05
+
+
+def write_random_file(path, size, rand):
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, WRITE_CHUNK_SIZE)
+            f.write(rand.randbytes(chunk))
+            remaining -= chunk
+
+
+def create_project(root, scenario, seed):
+    """Generates a project folder for a scenario"""
+    models, model_size, images, image_size = SCENARIOS[scenario]
+    project_path = os.path.join(root, scenario)
+    os.makedirs(project_path)
+    threedeploy.create_initial_folder_structure(project_path)
+
+    datapath = os.path.join(project_path, "thingdata.json")
+    with open(datapath, "r", encoding="utf-8") as f:
+        thingdata = json.load(f)
+    thingdata["thingiverse_creator"] = BENCHMARK_CREATOR
+    thingdata["thingiverse_is_published"] = True
+    with open(datapath, "w", encoding="utf-8") as f:
+        f.write(json.dumps(thingdata, indent=4))
+
+    rand = random.Random(seed)
+    for number in range(models):
+        write_random_file(os.path.join(project_path, "3d", "part%03d.stl" % number),
+                          model_size, rand)
+    for number in range(images):
+        write_random_file(os.path.join(project_path, "img", "%02d-image.png" % number),
+                          image_size, rand)
+    return project_path
+
+
+def start_mockserver(args):
+    """Starts the stand-in in its own process, so it is not traced"""
+    process = subprocess.Popen(
+                [sys.executable, "-m", "threedeploy.mockserver", "--port", "0",
+                 "--creator", BENCHMARK_CREATOR,
+                 "--latency", str(args.latency),
+                 "--rate-limit", str(args.server_rate_limit),
+                 "--error-rate", str(args.error_rate),
+                 "--seed", "1"],
+                cwd=REPO_PATH, stdout=subprocess.PIPE, text=True)
+    urls = process.stdout.readline().split()
+    return process, urls[1], urls[3]
+
+
+def run_deploy(project_path):
+    """Deploys a project, returns wall time, requests and peak memory.
+
+    A failed deployment, e.g. from injected errors, is returned with its
+    error instead of raising.
+    """
+    error = None
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        threedeploy.deploy_project(project_path, "benchmark", "thingiverse")
+    except (Exception, SystemExit) as e:
+        error = "%s: %s" % (type(e).__name__, e)
+    finally:
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    with open(os.path.join(project_path, threedeploy.REPORT_FILE_NAME),
+              "r", encoding="utf-8") as f:
+        report = json.load(f)
+    return {"seconds":   round(seconds, 3),
+            "requests":  len(report["calls"]),
+            "peak_kib":  peak // 1024,
+            "error":     error,
+            "phases":    {phase["name"]: phase["seconds"]
+                          for phase in report["phases"]}}
+
+
+def run_scenario(scenario, args):
+    root = tempfile.mkdtemp(prefix="threedeploy-bench-")
+    process, api_url, upload_url = start_mockserver(args)
+    try:
+        project_path = create_project(root, scenario, args.seed)
+        threedeploy.FINGERPRINT_CACHE = os.path.join(root, "fingerprints.json")
+        threedeploy.THINGIVERSE_API_URL = api_url
+        threedeploy.THINGIVERSE_UPLOAD_URL = upload_url
+        return {"create": run_deploy(project_path),
+                "noop":   run_deploy(project_path)}
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance):
+    """Returns the regressions of results against a baseline"""
+    regressions = []
+    for scenario, runs in results.items():
+        for run, result in runs.items():
+            before = baseline.get(scenario, {}).get(run)
+            if before is None:
+                continue
+            name = scenario + " " + run
+            if result.get("error"):
+                regressions.append("%s: failed with %s" % (name, result["error"]))
+                continue
+            if result["seconds"] > before["seconds"] * (1 + tolerance) + TIME_SLACK:
+                regressions.append("%s: %.3f s, baseline %.3f s"
+                                   % (name, result["seconds"], before["seconds"]))
+            if result["requests"] > before["requests"]:
+                regressions.append("%s: %d requests, baseline %d"
+                                   % (name, result["requests"], before["requests"]))
+            if result["peak_kib"] > before["peak_kib"] * (1 + tolerance):
+                regressions.append("%s: %d KiB peak, baseline %d KiB"
+                                   % (name, result["peak_kib"], before["peak_kib"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=
+                     "Benchmark deployments against threedeploy.mockserver")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run, may be repeated. Default: all")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Seconds every mock request takes")
+    parser.add_argument("--server-rate-limit", type=float, default=0.0,
+                        help="Requests per second the mock allows, 0 for no limit")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="Requests per second the client sends, 0 for no limit")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Share of mock requests failing with 503. Failed "
+                             "POST and PATCH requests are not retried and fail "
+                             "the run")
+    parser.add_argument("--upload-workers", type=int,
+                        default=threedeploy.THINGIVERSE_UPLOAD_WORKERS)
+    parser.add_argument("--asyncio", action="store_true",
+                        help="Deploy over the asyncio client")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed for the generated file contents")
+    parser.add_argument("--json", type=str, default=None,
+                        help="Write the results to this file")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Fail on regressions against this --json output")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed share of additional time and memory")
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING,
+                        format=threedeploy.LOGGING_DEFAULT_FORMAT)
+    threedeploy.THINGIVERSE_RATE_LIMIT = args.rate_limit
+    threedeploy.THINGIVERSE_UPLOAD_WORKERS = args.upload_workers
+    threedeploy.THINGIVERSE_ASYNCIO = args.asyncio
+    threedeploy.THINGIVERSE_RESPONSE_CACHE = ""
+
+    results = {}
+    print("%-10s %-7s %9s %9s %11s" % ("Scenario", "Run", "Seconds", "Requests",
+                                       "Peak KiB"))
+    for scenario in args.scenario or list(SCENARIOS):
+        results[scenario] = run_scenario(scenario, args)
+        for run, result in results[scenario].items():
+            print("%-10s %-7s %9.3f %9d %11d  %s" % (scenario, run,
+                                                     result["seconds"],
+                                                     result["requests"],
+                                                     result["peak_kib"],
+                                                     result["error"] or ""))
+        sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(json.dumps(results, indent=4))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("Regression: " + regression)
+        if regressions:
+            sys.exit(1)
+    elif any(result["error"] for runs in results.values()
+             for result in runs.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
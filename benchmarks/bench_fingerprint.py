@@ -0,0 +1,144 @@
+"""File fingerprinting benchmark on a synthetic multi-GB project.
+
+    python benchmarks/bench_fingerprint.py
+    python benchmarks/bench_fingerprint.py --size-gib 8 --workers 8
+    python benchmarks/bench_fingerprint.py --drop-caches
+
+Generates a project of a few large and many small model files and hashes
+it in four ways:
+
+- "chunked": every file read in 1 MiB chunks, one after another, as
+  deployments did before the fingerprint cache
+- "mmap": threedeploy.file_sha256, every file memory-mapped, one after
+  another
+- "cold": FingerprintCache.hash_files with an empty cache, files hashed on
+  --workers threads
+- "warm": a fresh scan of the project and FingerprintCache.hash_files with
+  the cache written by "cold", so every file costs the stat() of the scan
+
+Unless --drop-caches is given (Linux, needs root), the generated files are
+most likely in the page cache, so the cold runs measure hashing rather than
+the disk.
+"""
+import argparse
+import hashlib
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+from threedeploy import threedeploy
+
+
+LARGE_FILE_SIZE = 256 * 1024 * 1024
+SMALL_FILE_SIZE = 1024 * 1024
+# Share of the project size in small files
+SMALL_FILES_SHARE = 0.25
+WRITE_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def create_project(root, size, seed):
+    """Generates model files adding up to about size bytes"""
+    rand = random.Random(seed)
+    modelpath = os.path.join(root, "3d")
+    os.makedirs(modelpath)
+
+    small_files = int(size * SMALL_FILES_SHARE) // SMALL_FILE_SIZE
+    large_files = max(1, (size - small_files * SMALL_FILE_SIZE) // LARGE_FILE_SIZE)
+    # Random data is slow to generate, repeat one block per file
+    block = rand.randbytes(WRITE_CHUNK_SIZE)
+    for number in range(large_files):
+        with open(os.path.join(modelpath, "large%03d.stl" % number), "wb") as f:
+            f.write(number.to_bytes(8, "little"))
+            for _ in range(LARGE_FILE_SIZE // WRITE_CHUNK_SIZE):
+                f.write(block)
+    for number in range(small_files):
+        with open(os.path.join(modelpath, "small%05d.stl" % number), "wb") as f:
+            f.write(rand.randbytes(SMALL_FILE_SIZE))
+
+
+def drop_caches():
+    os.sync()
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def chunked_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def timed(name, function, total_bytes, args):
+    if args.drop_caches:
+        drop_caches()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    print("%-8s %9.3f %10.1f" % (name, seconds,
+                                 total_bytes / (1024 * 1024) / seconds))
+    sys.stdout.flush()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=
+                     "Benchmark hashing and caching of project files")
+    parser.add_argument("--size-gib", type=float, default=2.0,
+                        help="Size of the generated project")
+    parser.add_argument("--workers", type=int,
+                        default=threedeploy.FINGERPRINT_WORKERS,
+                        help="Threads hashing files at the same time")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed for the generated file contents")
+    parser.add_argument("--drop-caches", action="store_true",
+                        help="Drop the page cache before every run")
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING,
+                        format=threedeploy.LOGGING_DEFAULT_FORMAT)
+    threedeploy.FINGERPRINT_WORKERS = args.workers
+
+    root = tempfile.mkdtemp(prefix="threedeploy-fingerprint-")
+    try:
+        create_project(root, int(args.size_gib * 1024 ** 3), args.seed)
+        files = threedeploy.scan_project_files(root)["3d"]
+        total_bytes = sum(file.size for file in files)
+        print("%d files, %.2f GiB, %d workers" % (len(files),
+                                                  total_bytes / 1024 ** 3,
+                                                  args.workers))
+        print("%-8s %9s %10s" % ("Run", "Seconds", "MiB/s"))
+
+        cachepath = os.path.join(root, "fingerprints.json")
+
+        def cold():
+            cache = threedeploy.FingerprintCache(cachepath)
+            cache.hash_files(files)
+            cache.save()
+
+        def warm():
+            cache = threedeploy.FingerprintCache(cachepath)
+            cache.hash_files(threedeploy.scan_project_files(root)["3d"])
+            if cache.stats["misses"]:
+                raise RuntimeError("%d files hashed again" % cache.stats["misses"])
+
+        timed("chunked", lambda: [chunked_sha256(file.path) for file in files],
+              total_bytes, args)
+        timed("mmap", lambda: [threedeploy.file_sha256(file.path) for file in files],
+              total_bytes, args)
+        timed("cold", cold, total_bytes, args)
+        timed("warm", warm, total_bytes, args)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Start-up time of the threedeploy command line.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 50 --json startup.json
+    python benchmarks/bench_startup.py --baseline startup.json
+
+Every case runs `python -m threedeploy` in a fresh interpreter, --repeat
+times, from an empty working directory so no logging.yaml is picked up.
+The package is byte-compiled first, as it would be when installed.
+The median wall time is reported next to the plain interpreter start-up,
+together with the modules a case imports that should only be loaded by
+the modes using them.
+
+With --baseline, the results are compared to an earlier --json output and
+the script exits with 1 if a case got slower than --tolerance allows.
+"""
+import argparse
+import compileall
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name: arguments passed to python -m threedeploy, "{path}" is a temporary
+# empty project folder
+CASES = {
+    "interpreter":    None,
+    "import":         [],
+    "help":           ["--help"],
+    "create-project": ["--create-project", "--path", "{path}"],
+}
+
+# Modules the network stack, config parsing and asyncio pull in
+HEAVY_MODULES = ("requests", "urllib3", "yaml", "asyncio", "webbrowser",
+                 "logging.config", "zipfile", "multiprocessing")
+
+# Runs this short jitter more than the tolerance allows
+TIME_SLACK = 0.01
+
+# Only counts what the import adds, site hooks may load some modules already
+LOADED_MODULES_CODE = """
+import sys
+before = set(sys.modules)
+import threedeploy.threedeploy
+print(" ".join(name for name in %r
+               if name in sys.modules and name not in before))
+""" % (HEAVY_MODULES,)
+
+
+def case_command(case, path):
+    arguments = CASES[case]
+    if arguments is None:
+        return [sys.executable, "-c", "pass"]
+    if not arguments:
+        return [sys.executable, "-c", "import threedeploy.threedeploy"]
+    return ([sys.executable, "-m", "threedeploy"]
+            + [argument.format(path=path) for argument in arguments])
+
+
+def time_case(case, repeat, workdir):
+    """Returns the median wall time of a case over repeat runs"""
+    env = dict(os.environ, PYTHONPATH=REPO_PATH)
+    timings = []
+    for number in range(repeat):
+        path = os.path.join(workdir, "project%d" % number)
+        os.makedirs(path)
+        start = time.perf_counter()
+        subprocess.run(case_command(case, path), cwd=workdir, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        timings.append(time.perf_counter() - start)
+        shutil.rmtree(path)
+    return statistics.median(timings)
+
+
+def loaded_modules(workdir):
+    """Returns the heavy modules imported with threedeploy.threedeploy"""
+    env = dict(os.environ, PYTHONPATH=REPO_PATH)
+    output = subprocess.run([sys.executable, "-c", LOADED_MODULES_CODE],
+                            cwd=workdir, env=env, stdout=subprocess.PIPE,
+                            text=True, check=True).stdout
+    return output.split()
+
+
+def compare(results, baseline, tolerance):
+    """Returns the regressions of results against a baseline"""
+    regressions = []
+    for case, seconds in results["seconds"].items():
+        before = baseline.get("seconds", {}).get(case)
+        if before is None or case == "interpreter":
+            continue
+        if seconds > before * (1 + tolerance) + TIME_SLACK:
+            regressions.append("%s: %.3f s, baseline %.3f s"
+                               % (case, seconds, before))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=
+                     "Benchmark the start-up time of the threedeploy command")
+    parser.add_argument("--case", action="append", choices=list(CASES),
+                        help="Case to run, may be repeated. Default: all")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="Runs per case, the median is reported")
+    parser.add_argument("--json", type=str, default=None,
+                        help="Write the results to this file")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Fail on regressions against this --json output")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed share of additional time")
+    args = parser.parse_args()
+
+    compileall.compile_dir(os.path.join(REPO_PATH, "threedeploy"), quiet=1)
+
+    workdir = tempfile.mkdtemp(prefix="threedeploy-startup-")
+    try:
+        results = {"seconds": {}, "loaded_modules": loaded_modules(workdir)}
+        print("%-15s %9s" % ("Case", "Seconds"))
+        for case in args.case or list(CASES):
+            results["seconds"][case] = round(time_case(case, args.repeat, workdir), 4)
+            print("%-15s %9.4f" % (case, results["seconds"][case]))
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("Heavy modules loaded on import: "
+          + (" ".join(results["loaded_modules"]) or "none"))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(json.dumps(results, indent=4))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("Regression: " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Fixtures running threedeploy against threedeploy.mockserver"""
+import json
+import os
+
+import pytest
+
+from threedeploy import threedeploy
+from threedeploy.mockserver import MockServer
+
+
+# Creator the stand-in reports for every Thing
+MOCK_CREATOR = "threedeploy"
+
+
+@pytest.fixture(autouse=True)
+def isolated_settings(monkeypatch):
+    """Keeps tests away from the user's caches and from slow retries"""
+    monkeypatch.setattr(threedeploy, "THINGIVERSE_RESPONSE_CACHE", "")
+    monkeypatch.setattr(threedeploy, "FINGERPRINT_CACHE", "")
+    monkeypatch.setattr(threedeploy, "THINGIVERSE_RATE_LIMIT", 0.0)
+    monkeypatch.setattr(threedeploy, "THINGIVERSE_RETRY_BASE_DELAY", 0.01)
+    monkeypatch.setattr(threedeploy, "THINGIVERSE_REFRESH_TIMEOUT", 1)
+    monkeypatch.setattr(threedeploy, "GIT_INCREMENTAL", False)
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """A running stand-in, with threedeploy pointed at it"""
+    with MockServer() as server:
+        monkeypatch.setattr(threedeploy, "THINGIVERSE_API_URL", server.api_url)
+        monkeypatch.setattr(threedeploy, "THINGIVERSE_UPLOAD_URL", server.upload_url)
+        yield server
+
+
+def endpoint_count(server, key):
+    """Returns how often the stand-in answered "METHOD /things/{id}/..." """
+    return server.thingiverse.stats["endpoints"].get(key, 0)
+
+
+@pytest.fixture
+def make_project(tmp_path):
+    """Returns a function creating a project with model files and images"""
+    def make_project(name="project", models=3, images=1):
+        project_path = str(tmp_path / name)
+        os.makedirs(project_path)
+        threedeploy.create_initial_folder_structure(project_path)
+
+        datapath = os.path.join(project_path, "thingdata.json")
+        with open(datapath, "r", encoding="utf-8") as f:
+            thingdata = json.load(f)
+        thingdata["thingiverse_creator"] = MOCK_CREATOR
+        with open(datapath, "w", encoding="utf-8") as f:
+            f.write(json.dumps(thingdata, indent=4))
+
+        for number in range(models):
+            with open(os.path.join(project_path, "3d", "part%d.stl" % number),
+                      "wb") as f:
+                f.write(os.urandom(1024 + number))
+        for number in range(images):
+            with open(os.path.join(project_path, "img", "%02d-image.png" % number),
+                      "wb") as f:
+                f.write(os.urandom(512))
+        return project_path
+
+    return make_project
+
+
+def read_thingdata(project_path):
+    with open(os.path.join(project_path, "thingdata.json"), "r",
+              encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,122 @@
+"""ThingiverseClient retries, rate limits, timeouts and response cache"""
+import time
+
+import pytest
+import requests
+
+from threedeploy import threedeploy
+
+from conftest import endpoint_count
+
+
+@pytest.fixture
+def thing(mock_server):
+    """A Thing on the stand-in, returns its API path"""
+    with threedeploy.ThingiverseClient("token") as client:
+        created = client.post("/things/", data='{"name": "Thing"}').json()
+    return "/things/%d" % created["id"]
+
+
+def test_throttled_requests_are_retried_after_retry_after(mock_server, thing):
+    mock_server.thingiverse.rate_limit = 0.5
+    mock_server.thingiverse.rate_burst = 1
+    mock_server.thingiverse._tokens = 0.0
+
+    with threedeploy.ThingiverseClient("token") as client:
+        start = time.monotonic()
+        response = client.patch(thing, data='{"name": "Patched"}')
+        seconds = time.monotonic() - start
+
+    assert response.status_code == 200
+    assert client.stats["retries"] >= 1
+    assert mock_server.thingiverse.stats["throttled"] >= 1
+    # The stand-in asks to retry after one second
+    assert seconds >= 1.0
+
+
+def test_rate_limit_keeps_requests_below_the_server_limit(mock_server, thing):
+    mock_server.thingiverse.rate_limit = 5.0
+    mock_server.thingiverse.rate_burst = 2
+    limiter = threedeploy.RateLimiter(4.0, 1)
+
+    with threedeploy.ThingiverseClient("token", limiter=limiter) as client:
+        start = time.monotonic()
+        for _ in range(5):
+            assert client.get(thing).status_code == 200
+        seconds = time.monotonic() - start
+
+    assert mock_server.thingiverse.stats["throttled"] == 0
+    assert client.stats["throttle_waits"] >= 3
+    assert seconds >= 0.9
+
+
+def test_server_errors_are_only_retried_for_idempotent_requests(mock_server, thing):
+    mock_server.thingiverse.error_rate = 1.0
+    retries = threedeploy.THINGIVERSE_MAX_RETRIES
+
+    with threedeploy.ThingiverseClient("token") as client:
+        with pytest.raises(requests.HTTPError):
+            client.get(thing)
+        assert client.stats["retries"] == retries
+
+        with pytest.raises(requests.HTTPError):
+            client.post(thing + "/publish")
+        assert client.stats["retries"] == retries
+
+
+def test_stalled_requests_time_out(mock_server, thing, monkeypatch):
+    monkeypatch.setattr(threedeploy, "THINGIVERSE_MAX_RETRIES", 1)
+    mock_server.thingiverse.latency = 1.0
+
+    with threedeploy.ThingiverseClient("token", timeout=(1.0, 0.2)) as client:
+        start = time.monotonic()
+        with pytest.raises(requests.Timeout):
+            client.get(thing)
+        assert client.stats["retries"] == 1
+        with pytest.raises(requests.Timeout):
+            client.post(thing + "/publish")
+        assert client.stats["retries"] == 1
+        assert time.monotonic() - start < 1.5
+
+
+def test_default_timeout_comes_from_the_settings(monkeypatch):
+    monkeypatch.setattr(threedeploy, "THINGIVERSE_CONNECT_TIMEOUT", 3.0)
+    monkeypatch.setattr(threedeploy, "THINGIVERSE_READ_TIMEOUT", 7.0)
+
+    with threedeploy.ThingiverseClient("token") as client:
+        assert client.timeout == (3.0, 7.0)
+        assert client.fork().timeout == (3.0, 7.0)
+
+
+def test_unchanged_responses_are_revalidated(mock_server, thing, tmp_path):
+    cachepath = str(tmp_path / "responses.json")
+
+    with threedeploy.ThingiverseClient(
+            "token", cache=threedeploy.ResponseCache(cachepath)) as client:
+        first = client.get(thing).json()
+        second = client.get(thing)
+        assert second.status_code == 200
+        assert second.json() == first
+        assert client.cache.stats["hits"] == 1
+        client.cache.save()
+
+    # A new run revalidates what the last one saved
+    with threedeploy.ThingiverseClient(
+            "token", cache=threedeploy.ResponseCache(cachepath)) as client:
+        assert client.get(thing).json() == first
+        assert client.cache.stats["hits"] == 1
+
+    assert mock_server.thingiverse.stats["not_modified"] == 2
+    assert endpoint_count(mock_server, "GET /things/{id}") == 3
+
+
+def test_writes_drop_cached_responses_of_their_thing(mock_server, thing, tmp_path):
+    cache = threedeploy.ResponseCache(str(tmp_path / "responses.json"))
+
+    with threedeploy.ThingiverseClient("token", cache=cache) as client:
+        client.get(thing)
+        client.patch(thing, data='{"name": "Patched"}')
+        assert client.get(thing).json()["name"] == "Patched"
+
+    assert cache.stats["hits"] == 0
+    assert mock_server.thingiverse.stats["not_modified"] == 0
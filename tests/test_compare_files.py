@@ -0,0 +1,126 @@
+"""Plans of thingiverse_compare_files, and the hashes they record"""
+import os
+
+from threedeploy import threedeploy
+
+from conftest import read_thingdata
+
+
+def model_files(project_path):
+    return threedeploy.scan_project_files(project_path)["3d"]
+
+
+def remote_file(file_id, name, date="2000-01-01 00:00:00"):
+    return {"id": file_id, "name": name, "date": date}
+
+
+def record(file_id, localfile):
+    return {"id":     file_id,
+            "sha256": threedeploy.file_sha256(localfile.path),
+            "size":   localfile.size}
+
+
+def names(entries):
+    return sorted(entry["name"] for entry in entries)
+
+
+def test_new_files_are_uploaded_with_their_planned_hash(make_project):
+    files = model_files(make_project())
+
+    plan = threedeploy.thingiverse_compare_files("/files", files, [], [], {})
+
+    assert names(plan["upload"]) == ["part0.stl", "part1.stl", "part2.stl"]
+    for entry, localfile in zip(plan["upload"], files):
+        assert entry["sha256"] == threedeploy.file_sha256(localfile.path)
+    assert plan["replace"] == plan["delete"] == plan["keep"] == []
+
+
+def test_manifest_hashes_decide_between_keep_and_replace(make_project):
+    project_path = make_project()
+    files = model_files(project_path)
+    remote = [remote_file(1, "part0.stl"), remote_file(2, "part1.stl")]
+    deployed = {"part0.stl": record(1, files[0]),
+                "part1.stl": dict(record(2, files[1]), sha256="0" * 64)}
+
+    plan = threedeploy.thingiverse_compare_files("/files", files, remote, [],
+                                                 deployed)
+
+    assert names(plan["keep"]) == ["part0.stl"]
+    assert [pair["remote"]["id"] for pair in plan["replace"]] == [2]
+    assert plan["replace"][0]["local"]["sha256"] == \
+        threedeploy.file_sha256(files[1].path)
+    assert names(plan["upload"]) == ["part2.stl"]
+
+
+def test_files_without_record_compare_timestamps(make_project):
+    files = model_files(make_project())
+    remote = [remote_file(1, "part0.stl", "2000-01-01 00:00:00"),
+              remote_file(2, "part1.stl", "2999-01-01 00:00:00")]
+
+    plan = threedeploy.thingiverse_compare_files("/files", files, remote, [], {})
+
+    assert [pair["local"]["name"] for pair in plan["replace"]] == ["part0.stl"]
+    assert names(plan["keep"]) == ["part1.stl"]
+
+
+def test_remote_files_gone_locally_and_outdated_copies_are_deleted(make_project):
+    files = model_files(make_project())
+    remote = [remote_file(1, "part0.stl"), remote_file(2, "part0.stl"),
+              remote_file(3, "removed.stl")]
+    deployed = {"part0.stl": record(2, files[0])}
+
+    plan = threedeploy.thingiverse_compare_files("/files", files, remote, [],
+                                                 deployed)
+
+    assert sorted(entry["id"] for entry in plan["delete"]) == [1, 3]
+    assert [entry["id"] for entry in plan["keep"]] == [2]
+
+
+def test_previews_of_model_files_are_kept(make_project):
+    project_path = make_project()
+    images = threedeploy.scan_project_files(project_path)["img"]
+    remote = [remote_file(1, "part0.png"), remote_file(2, "old.png"),
+              remote_file(3, "00-image.png")]
+
+    plan = threedeploy.thingiverse_compare_files("/images", images, remote,
+                                                 model_files(project_path), {})
+
+    assert [entry["id"] for entry in plan["delete"]] == [2]
+    assert plan["upload"] == [] and plan["replace"] == []
+
+
+def test_scope_limits_both_sides(make_project):
+    files = model_files(make_project())
+    remote = [remote_file(1, "gone.stl"), remote_file(2, "other.stl")]
+
+    plan = threedeploy.thingiverse_compare_files("/files", files, remote, [], {},
+                                                 scope={"part1.stl", "gone.stl"})
+
+    assert names(plan["upload"]) == ["part1.stl"]
+    assert [entry["id"] for entry in plan["delete"]] == [1]
+
+
+def test_file_edited_during_upload_is_uploaded_again(make_project, mock_server,
+                                                     monkeypatch):
+    project_path = make_project()
+    edited = os.path.join(project_path, "3d", "part1.stl")
+    upload_file = threedeploy.thingiverse_upload_file
+
+    def upload_and_edit(file, thingdata, client, *args):
+        result = upload_file(file, thingdata, client, *args)
+        if file["path"] == edited:
+            # Same size, only the content hash tells the versions apart
+            with open(edited, "wb") as f:
+                f.write(os.urandom(file["size"]))
+        return result
+
+    monkeypatch.setattr(threedeploy, "thingiverse_upload_file", upload_and_edit)
+    threedeploy.deploy_project(project_path, "token", "thingiverse")
+    monkeypatch.setattr(threedeploy, "thingiverse_upload_file", upload_file)
+
+    plan = threedeploy.deploy_project(project_path, "token", "thingiverse",
+                                      plan_only=True)
+
+    assert read_thingdata(project_path)["thingiverse_id"] != ""
+    assert [pair["local"]["name"] for pair in plan["files"]["replace"]] == \
+        ["part1.stl"]
@@ -0,0 +1,141 @@
+"""Deployments against the stand-in: resuming, fan-out and destinations"""
+import json
+import os
+
+import pytest
+
+from threedeploy import threedeploy
+
+from conftest import endpoint_count, read_thingdata
+
+
+def remote_names(server, project_path, kind="files"):
+    thing = server.thingiverse.things[str(read_thingdata(project_path)["thingiverse_id"])]
+    return sorted(record["name"] for record in thing[kind])
+
+
+def test_deploy_creates_the_thing_and_redeploys_nothing(make_project, mock_server):
+    project_path = make_project()
+
+    threedeploy.deploy_project(project_path, "token", "thingiverse")
+    requests = mock_server.thingiverse.stats["requests"]
+    plan = threedeploy.deploy_project(project_path, "token", "thingiverse")
+
+    assert remote_names(mock_server, project_path) == \
+        ["part0.stl", "part1.stl", "part2.stl"]
+    assert threedeploy.thingiverse_plan_is_empty(plan)
+    # The Thing, its files and its images are listed, nothing else
+    assert mock_server.thingiverse.stats["requests"] - requests == 3
+
+
+def test_interrupted_deploy_resumes_from_the_journal(make_project, mock_server,
+                                                     monkeypatch):
+    project_path = make_project(models=4)
+    monkeypatch.setattr(threedeploy, "THINGIVERSE_UPLOAD_WORKERS", 1)
+    upload_file = threedeploy.thingiverse_upload_file
+    uploads = []
+
+    def failing_upload(file, thingdata, client, *args):
+        if len(uploads) == 2:
+            raise RuntimeError("connection lost")
+        uploads.append(file["name"])
+        return upload_file(file, thingdata, client, *args)
+
+    monkeypatch.setattr(threedeploy, "thingiverse_upload_file", failing_upload)
+    with pytest.raises(RuntimeError):
+        threedeploy.deploy_project(project_path, "token", "thingiverse")
+    assert os.path.isfile(os.path.join(project_path,
+                                       threedeploy.JOURNAL_FILE_NAME))
+
+    monkeypatch.setattr(threedeploy, "thingiverse_upload_file", upload_file)
+    plan = threedeploy.deploy_project(project_path, "token", "thingiverse")
+
+    # Only the files the first run did not finish are uploaded again
+    assert names_of(plan["files"]["upload"]) == \
+        sorted({"part0.stl", "part1.stl", "part2.stl", "part3.stl"} - set(uploads))
+    assert endpoint_count(mock_server, "POST /things") == 1
+    # Four model files and one image, each transferred once
+    assert endpoint_count(mock_server, "POST /upload_file_storage") == 5
+    assert remote_names(mock_server, project_path) == \
+        ["part0.stl", "part1.stl", "part2.stl", "part3.stl"]
+    assert not os.path.exists(os.path.join(project_path,
+                                           threedeploy.JOURNAL_FILE_NAME))
+
+
+def names_of(entries):
+    return sorted(entry["name"] for entry in entries)
+
+
+def test_mirror_copies_thingdata_after_creation(make_project, mock_server, tmp_path):
+    project_path = make_project()
+    mirror = str(tmp_path / "mirror")
+
+    def backends():
+        return [threedeploy.ThingiverseBackend("token"),
+                threedeploy.DirectoryBackend(mirror)]
+
+    summary = threedeploy.deploy_project_destinations(project_path, backends())
+    assert [outcome["status"] for outcome in summary] == ["ok", "ok"]
+
+    with open(os.path.join(mirror, "project", "thingdata.json"), "r",
+              encoding="utf-8") as f:
+        assert json.load(f) == read_thingdata(project_path)
+
+    threedeploy.deploy_project_destinations(project_path, backends(),
+                                            plan_only=True)
+    with open(os.path.join(project_path, threedeploy.DIRECTORY_PLAN_FILE_NAME),
+              "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    assert plan["copy"] == [] and plan["delete"] == []
+
+
+def test_failing_destination_does_not_stop_the_others(make_project, tmp_path):
+    project_path = make_project()
+    blocked = tmp_path / "blocked"
+    blocked.write_text("not a folder")
+
+    summary = threedeploy.deploy_project_destinations(
+                project_path, [threedeploy.DirectoryBackend(str(blocked)),
+                               threedeploy.DirectoryBackend(str(tmp_path / "ok"))])
+
+    assert [outcome["status"] for outcome in summary] == ["failed", "ok"]
+    assert os.path.isfile(str(tmp_path / "ok" / "project" / "3d" / "part0.stl"))
+
+
+def test_unknown_destination_exits_with_usage_error(make_project):
+    with pytest.raises(SystemExit) as exit_info:
+        threedeploy.deploy_project(make_project(), "token", "nowhere")
+    assert exit_info.value.code == os.EX_USAGE
+
+
+class ScriptedWatcher:
+    def close(self):
+        pass
+
+
+def test_watch_retries_the_changes_of_a_failed_round(monkeypatch):
+    statuses = iter(["ok", "ok", "failed", "ok", "failed", "ok"])
+    changes = iter([{"3d/a.stl"}, {"3d/b.stl"}, {"3d/c.stl"}, None, {"3d/d.stl"}])
+    deployed = []
+
+    def deploy(project_path, backends, changes=None):
+        deployed.append(changes)
+        return [{"destination": "test", "status": next(statuses)}]
+
+    def wait(watcher):
+        try:
+            return next(changes)
+        except StopIteration:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(threedeploy, "open_project_watcher",
+                        lambda project_path: ScriptedWatcher())
+    monkeypatch.setattr(threedeploy, "deploy_project_destinations", deploy)
+    monkeypatch.setattr(threedeploy, "wait_for_project_changes", wait)
+
+    threedeploy.watch_project("project", [])
+
+    # A failed round is repeated together with the next changes, unknown
+    # changes fall back to comparing the whole project
+    assert deployed == [None, {"3d/a.stl"}, {"3d/b.stl"},
+                        {"3d/b.stl", "3d/c.stl"}, None, None]
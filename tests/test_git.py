@@ -0,0 +1,73 @@
+"""Deploying only the files changed since the deployed git commit"""
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from threedeploy import threedeploy
+
+from conftest import endpoint_count
+
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None,
+                                reason="git is not installed")
+
+
+def git(project_path, *args):
+    return subprocess.run(["git", "-C", project_path] + list(args), check=True,
+                          stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+
+def commit_all(project_path, message):
+    git(project_path, "add", "-A")
+    git(project_path, "-c", "user.name=test", "-c", "user.email=test@example.com",
+        "commit", "-q", "-m", message)
+    return git(project_path, "rev-parse", "HEAD").strip()
+
+
+def read_deployed_commit(project_path):
+    with open(os.path.join(project_path, threedeploy.DEPLOYED_COMMIT_FILE_NAME),
+              "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def test_only_files_changed_since_the_deployed_commit_are_uploaded(
+        make_project, mock_server, monkeypatch):
+    project_path = make_project()
+    git(project_path, "init", "-q")
+    commit_all(project_path, "Initial")
+    monkeypatch.setattr(threedeploy, "GIT_INCREMENTAL", True)
+
+    threedeploy.deploy_project(project_path, "token", "thingiverse")
+    # The new Thing ID is recorded in thingdata.json
+    head = commit_all(project_path, "Deployed")
+
+    # One committed change, one uncommitted change and one untracked file
+    with open(os.path.join(project_path, "3d", "part0.stl"), "wb") as f:
+        f.write(os.urandom(1024))
+    head = commit_all(project_path, "Changed part0")
+    with open(os.path.join(project_path, "3d", "part1.stl"), "wb") as f:
+        f.write(os.urandom(1025))
+    with open(os.path.join(project_path, "3d", "part3.stl"), "wb") as f:
+        f.write(os.urandom(256))
+    uploads = endpoint_count(mock_server, "POST /upload_file_storage")
+
+    plan = threedeploy.deploy_project(project_path, "token", "thingiverse")
+
+    assert [file["name"] for file in plan["files"]["upload"]] == ["part3.stl"]
+    assert sorted(pair["local"]["name"] for pair in plan["files"]["replace"]) == \
+        ["part0.stl", "part1.stl"]
+    assert endpoint_count(mock_server, "POST /upload_file_storage") - uploads == 3
+    assert read_deployed_commit(project_path) == head
+
+    # Files deployed before they were committed are compared once more
+    head = commit_all(project_path, "Committed the rest")
+    plan = threedeploy.deploy_project(project_path, "token", "thingiverse")
+    assert threedeploy.thingiverse_plan_is_empty(plan)
+    assert endpoint_count(mock_server, "POST /upload_file_storage") - uploads == 3
+    assert read_deployed_commit(project_path) == head
+
+    requests = mock_server.thingiverse.stats["requests"]
+    assert threedeploy.deploy_project(project_path, "token", "thingiverse") is None
+    assert mock_server.thingiverse.stats["requests"] == requests
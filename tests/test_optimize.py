@@ -0,0 +1,51 @@
+"""Pre-upload optimization of project files"""
+import os
+import struct
+
+import pytest
+
+from threedeploy import threedeploy
+
+
+def write_ascii_stl(path, facets):
+    with open(path, "w") as f:
+        f.write("solid test\n")
+        for normal, vertices in facets:
+            f.write("  facet normal %g %g %g\n" % normal)
+            f.write("    outer loop\n")
+            for vertex in vertices:
+                f.write("      vertex %g %g %g\n" % vertex)
+            f.write("    endloop\n")
+            f.write("  endfacet\n")
+        f.write("endsolid test\n")
+
+
+def binary_stl(facets):
+    data = threedeploy.BINARY_STL_HEADER.ljust(80, b" ")
+    data += struct.pack("<I", len(facets))
+    for normal, vertices in facets:
+        data += struct.pack("<3f", *normal)
+        for vertex in vertices:
+            data += struct.pack("<3f", *vertex)
+        data += struct.pack("<H", 0)
+    return data
+
+
+@pytest.mark.parametrize("chunk_size", [7, 100, 333, 4 * 1024 * 1024])
+def test_ascii_stl_conversion_does_not_depend_on_chunks(tmp_path, monkeypatch,
+                                                        chunk_size):
+    pytest.importorskip("numpy")
+    facets = [((0, 0, i % 2), ((i, 0.5, -1), (i + 1, 2.25, 0), (i, 3, 1e-3)))
+              for i in range(40)]
+    source = str(tmp_path / "model.stl")
+    write_ascii_stl(source, facets)
+    destination = str(tmp_path / "model.binary.stl")
+
+    # Small chunks cut facets, numbers and keywords at every position
+    monkeypatch.setattr(threedeploy, "STL_PARSE_CHUNK_SIZE", chunk_size)
+    threedeploy.convert_ascii_stl(source, destination)
+
+    with open(destination, "rb") as f:
+        assert f.read() == binary_stl(facets)
+    # No temporary file is left behind
+    assert sorted(os.listdir(str(tmp_path))) == ["model.binary.stl", "model.stl"]
@@ -0,0 +1,18 @@
+"""Scanning project folders"""
+import os
+
+from threedeploy import threedeploy
+
+
+def test_symlinked_folders_are_scanned_once(make_project):
+    project_path = make_project(models=1, images=0)
+    os.makedirs(os.path.join(project_path, "3d", "sub"))
+    with open(os.path.join(project_path, "3d", "sub", "nested.stl"), "wb") as f:
+        f.write(b"nested")
+    # A loop back up the tree, and a second way into the same folder
+    os.symlink("..", os.path.join(project_path, "3d", "sub", "up"))
+    os.symlink("sub", os.path.join(project_path, "3d", "link"))
+
+    files = threedeploy.scan_project_files(project_path)["3d"]
+
+    assert sorted(file.name for file in files) == ["nested.stl", "part0.stl"]
@@ -0,0 +1,454 @@
+"""Local stand-in for the Thingiverse API, for offline runs and benchmarks.
+
+Implements the endpoints threedeploy uses: things, their files and images,
+the upload storage with its finalize redirect, image ranks and publishing.
+Things only live in memory. Latency, a rate limit and randomly failing
+requests can be configured to exercise the client.
+
+Run it with `python -m threedeploy.mockserver --port 8080` and point
+threedeploy at the --api-url and --upload-url it prints.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Paths of the API, the upload storage and the statistics of the stand-in
+MOCK_API_PREFIX = "/api"
+MOCK_UPLOAD_PATH = "/upload_file_storage"
+MOCK_STATS_PATH = "/_mock/stats"
+
+# File types that are listed as images, like on Thingiverse
+MOCK_IMAGE_TYPES = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+
+# Only the start of an upload is kept, the file field comes after the key
+MOCK_UPLOAD_HEAD_SIZE = 64 * 1024
+
+
+class MockThingiverse:
+    """In-memory Things served like the Thingiverse API.
+
+    Every request waits latency seconds. API requests above rate_limit per
+    second (with a burst of rate_burst) get a 429 with Retry-After, and a
+    share of error_rate of them fails with a 503 before changing anything.
+    Counters are kept in stats. Safe to use from many handler threads.
+    """
+
+    def __init__(self, base_url: str, creator: str = "threedeploy",
+                 latency: float = 0.0, rate_limit: float = 0.0,
+                 rate_burst: int = 10, error_rate: float = 0.0,
+                 seed=None) -> None:
+        self.base_url = base_url
+        self.creator = creator
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_burst = max(1, rate_burst)
+        self.error_rate = error_rate
+
+        self.things = {}
+        self.uploads = {}
+        self.stats = {"requests":       0,
+                      "throttled":      0,
+                      "errors":         0,
+                      "not_modified":   0,
+                      "bytes_uploaded": 0,
+                      "endpoints":      {}}
+
+        self._ids = itertools.count(1000)
+        self._random = random.Random(seed)
+        self._tokens = float(self.rate_burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def api_url(self) -> str:
+        return self.base_url + MOCK_API_PREFIX
+
+    @property
+    def upload_url(self) -> str:
+        return self.base_url + MOCK_UPLOAD_PATH
+
+    def count(self, method: str, endpoint: str) -> None:
+        key = method + " " + endpoint
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["endpoints"][key] = self.stats["endpoints"].get(key, 0) + 1
+
+    def throttled(self) -> bool:
+        """Takes a token of the rate limit, returns True if none was left"""
+        if self.rate_limit <= 0:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_burst, self._tokens
+                               + (now - self._updated) * self.rate_limit)
+            self._updated = now
+            if self._tokens < 1:
+                self.stats["throttled"] += 1
+                return True
+            self._tokens -= 1
+            return False
+
+    def failing(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            if self._random.random() >= self.error_rate:
+                return False
+            self.stats["errors"] += 1
+            return True
+
+    ########## API
+    def handle(self, method: str, parts: list, body: bytes):
+        """Answers an API request, returns status and JSON payload.
+
+        parts is the path below MOCK_API_PREFIX, split at "/".
+        """
+        if not parts or parts[0] != "things":
+            return 404, {"error": "Not Found"}
+
+        try:
+            params = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {"error": "Invalid JSON"}
+
+        with self._lock:
+            if len(parts) == 1:
+                if method == "POST":
+                    return 200, self.create_thing(params)
+                return 405, {"error": "Method Not Allowed"}
+
+            thing = self.things.get(parts[1])
+            if thing is None:
+                return 404, {"error": "Not Found"}
+
+            if len(parts) == 2:
+                if method == "GET":
+                    return 200, self.public_thing(thing)
+                if method == "PATCH":
+                    self.update_thing(thing, params)
+                    return 200, self.public_thing(thing)
+
+            elif parts[2] == "publish" and len(parts) == 3 and method == "POST":
+                thing["is_published"] = True
+                return 200, self.public_thing(thing)
+
+            elif parts[2] in ("files", "images"):
+                return self.handle_files(method, thing, parts[2], parts[3:], params)
+
+        return 405, {"error": "Method Not Allowed"}
+
+    def handle_files(self, method: str, thing: dict, kind: str, parts: list,
+                     params: dict):
+        if not parts:
+            if method == "GET":
+                return 200, thing[kind]
+            if method == "POST" and kind == "files":
+                return 200, self.open_upload(thing, params.get("filename", ""))
+            return 405, {"error": "Method Not Allowed"}
+
+        if len(parts) == 2 and parts[1] == "finalize" and method == "POST":
+            return self.finalize_upload(thing, parts[0])
+
+        record = next((record for record in thing[kind]
+                       if str(record["id"]) == parts[0]), None)
+        if record is None or len(parts) != 1:
+            return 404, {"error": "Not Found"}
+        if method == "DELETE":
+            thing[kind].remove(record)
+            return 200, record
+        if method == "PATCH" and kind == "images":
+            if "rank" in params:
+                record["rank"] = int(params["rank"])
+            return 200, record
+        return 405, {"error": "Method Not Allowed"}
+
+    ########## Things
+    def create_thing(self, params: dict) -> dict:
+        thing_id = next(self._ids)
+        thing = {"id":           thing_id,
+                 "name":         "",
+                 "creator":      {"name": self.creator},
+                 "is_published": False,
+                 "is_wip":       False,
+                 "tags":         [],
+                 "public_url":   "https://www.thingiverse.com/thing:%d" % thing_id,
+                 "added":        self.timestamp(),
+                 "files":        [],
+                 "images":       []}
+        self.update_thing(thing, params)
+        self.things[str(thing_id)] = thing
+        return self.public_thing(thing)
+
+    @staticmethod
+    def update_thing(thing: dict, params: dict) -> None:
+        for field, value in params.items():
+            if field == "tags":
+                value = [{"name": tag} for tag in value]
+            thing[field] = value
+        thing["modified"] = MockThingiverse.timestamp()
+
+    @staticmethod
+    def public_thing(thing: dict) -> dict:
+        return {field: value for field, value in thing.items()
+                if field not in ("files", "images")}
+
+    @staticmethod
+    def timestamp() -> str:
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+    ########## Uploads
+    def finalize_url(self, thing_id: int, key: str) -> str:
+        return "%s/things/%d/files/%s/finalize" % (self.api_url, thing_id, key)
+
+    def open_upload(self, thing: dict, filename: str) -> dict:
+        key = "upload%d" % next(self._ids)
+        self.uploads[key] = {"thing": thing["id"], "name": filename, "size": None}
+        return {"action": self.upload_url,
+                "fields": {"key": key,
+                           "acl": "public-read",
+                           "success_action_redirect":
+                               self.finalize_url(thing["id"], key)}}
+
+    def store_upload(self, key: str, size: int) -> str:
+        """Marks an upload as transferred, returns its finalize URL"""
+        with self._lock:
+            upload = self.uploads.get(key)
+            if upload is None:
+                return None
+            upload["size"] = size
+            self.stats["bytes_uploaded"] += size
+            return self.finalize_url(upload["thing"], key)
+
+    def finalize_upload(self, thing: dict, key: str):
+        upload = self.uploads.get(key)
+        if (upload is None or upload["size"] is None
+                or upload["thing"] != thing["id"]):
+            return 404, {"error": "Upload not found"}
+        del self.uploads[key]
+
+        name = upload["name"]
+        kind = "images" if name.lower().endswith(MOCK_IMAGE_TYPES) else "files"
+        record = {"id":   next(self._ids),
+                  "name": name,
+                  "size": upload["size"],
+                  "date": self.timestamp()}
+        if kind == "images":
+            record["rank"] = len(thing["images"])
+        thing[kind].append(record)
+
+        # Thingiverse renders a preview image of every STL file
+        if name.lower().endswith(".stl"):
+            thing["images"].append({"id":   next(self._ids),
+                                    "name": os.path.splitext(name)[0] + ".png",
+                                    "size": 0,
+                                    "date": record["date"],
+                                    "rank": len(thing["images"])})
+        return 200, record
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """Routes HTTP requests to the MockThingiverse of the server"""
+
+    protocol_version = "HTTP/1.1"
+
+    # Headers and body are written separately, which Nagle would delay
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self.dispatch("GET")
+
+    def do_POST(self) -> None:
+        self.dispatch("POST")
+
+    def do_PATCH(self) -> None:
+        self.dispatch("PATCH")
+
+    def do_DELETE(self) -> None:
+        self.dispatch("DELETE")
+
+    def dispatch(self, method: str) -> None:
+        mock = self.server.thingiverse
+        path = self.path.split("?", 1)[0]
+
+        if path == MOCK_STATS_PATH:
+            with mock._lock:
+                return self.send_json(200, mock.stats)
+
+        if mock.latency > 0:
+            time.sleep(mock.latency)
+
+        if path == MOCK_UPLOAD_PATH and method == "POST":
+            mock.count(method, MOCK_UPLOAD_PATH)
+            return self.receive_upload()
+
+        if not path.startswith(MOCK_API_PREFIX + "/"):
+            self.read_body()
+            return self.send_json(404, {"error": "Not Found"})
+
+        parts = [part for part in path[len(MOCK_API_PREFIX):].split("/") if part]
+        mock.count(method, "/" + "/".join("{id}" if part.isdigit() else part
+                                          for part in parts[:3]))
+        body = self.read_body()
+
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self.send_json(401, {"error": "Unauthorized"})
+        if mock.throttled():
+            return self.send_json(429, {"error": "Too Many Requests"},
+                                  {"Retry-After": "1"})
+        if mock.failing():
+            return self.send_json(503, {"error": "Service Unavailable"})
+
+        status, payload = mock.handle(method, parts, body)
+        self.send_json(status, payload, conditional=(method == "GET"))
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def receive_upload(self) -> None:
+        """Reads a multipart upload in chunks, keeping only its head"""
+        length = int(self.headers.get("Content-Length") or 0)
+        head = b""
+        remaining = length
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            if len(head) < MOCK_UPLOAD_HEAD_SIZE:
+                head += chunk[:MOCK_UPLOAD_HEAD_SIZE - len(head)]
+
+        key = multipart_field(head, "key")
+        location = None
+        if key is not None:
+            location = self.server.thingiverse.store_upload(key, length)
+        if location is None:
+            return self.send_json(400, {"error": "Unknown upload key"})
+        self.send_json(303, None, {"Location": location})
+
+    def send_json(self, status: int, payload, headers=None,
+                  conditional: bool = False) -> None:
+        content = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        headers = dict(headers or {})
+
+        if conditional and status == 200:
+            etag = '"%s"' % hashlib.md5(content).hexdigest()
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                with self.server.thingiverse._lock:
+                    self.server.thingiverse.stats["not_modified"] += 1
+                status, content = 304, b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Date", formatdate(usegmt=True))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def multipart_field(head: bytes, name: str):
+    """Returns the value of a form field from the start of a multipart body"""
+    marker = ('name="%s"' % name).encode("utf-8")
+    start = head.find(marker)
+    if start < 0:
+        return None
+    start = head.find(b"\r\n\r\n", start)
+    end = head.find(b"\r\n", start + 4)
+    if start < 0 or end < 0:
+        return None
+    return head[start + 4:end].decode("utf-8")
+
+
+class MockServer:
+    """Runs a MockThingiverse on a background thread.
+
+    Port 0 picks a free port. Use as a context manager, api_url and
+    upload_url are set once started.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **options) -> None:
+        self.httpd = ThreadingHTTPServer((host, port), MockRequestHandler)
+        self.httpd.daemon_threads = True
+        host, port = self.httpd.server_address[:2]
+        self.thingiverse = MockThingiverse("http://%s:%d" % (host, port), **options)
+        self.httpd.thingiverse = self.thingiverse
+        self._thread = None
+
+    @property
+    def api_url(self) -> str:
+        return self.thingiverse.api_url
+
+    @property
+    def upload_url(self) -> str:
+        return self.thingiverse.upload_url
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=
+                     "Serve a local stand-in for the Thingiverse API")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080,
+                        help="Port to listen on, 0 picks a free one")
+    parser.add_argument("--creator", type=str, default="threedeploy",
+                        help="Creator name reported for every Thing")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds every request takes")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="API requests per second before answering 429, "
+                             "0 disables the limit")
+    parser.add_argument("--rate-burst", type=int, default=10,
+                        help="API requests allowed at once")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Share of API requests failing with 503")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed for the injected errors")
+    args = parser.parse_args()
+
+    server = MockServer(args.host, args.port, creator=args.creator,
+                        latency=args.latency, rate_limit=args.rate_limit,
+                        rate_burst=args.rate_burst, error_rate=args.error_rate,
+                        seed=args.seed)
+
+    # The first line is read by the benchmarks to find the port
+    print("--api-url %s --upload-url %s" % (server.api_url, server.upload_url))
+    sys.stdout.flush()
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,31 @@
 #!/usr/bin/python
 import argparse
+import copy
+import functools
+import glob
+import hashlib
 import json
+import mmap
 import sys
 import os
-import requests
-import webbrowser
 import time
+import random
 import re
-import logging.config
-import yaml
+import select
+import struct
+import threading
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime, timezone
-from shutil import copyfile
-from requests import Response
+from shutil import copy2, copyfile
+from typing import TYPE_CHECKING, NamedTuple
+
+# requests, yaml, asyncio and friends are imported by the code that needs
+# them, so --help and --create-project start without loading them
+if TYPE_CHECKING:
+    from requests import Response
 
 
 logger = logging.getLogger(__name__)
@@ -23,6 +37,128 @@ logger = logging.getLogger(__name__)
 # The Thingiverse ID of this app for requesting an API key
 THINGIVERSE_CLIENT_ID = "844fde0b2950ccf35329"
 
+# Thingiverse endpoints
+THINGIVERSE_API_URL = "https://api.thingiverse.com"
+THINGIVERSE_UPLOAD_URL = "https://www.thingiverse.com/upload_file_storage"
+
+# Number of files transferred to Thingiverse at the same time
+THINGIVERSE_UPLOAD_WORKERS = 4
+
+# Number of projects deployed at the same time in batch mode
+BATCH_WORKERS = 4
+
+# Number of small API requests (e.g. image ranks) sent at the same time
+THINGIVERSE_API_WORKERS = 8
+
+# Number of keep-alive connections held open per host
+THINGIVERSE_POOL_SIZE = 16
+
+# Requests per second sent to the Thingiverse API, and how many may be
+# sent in a burst. A rate of 0 disables rate limiting.
+THINGIVERSE_RATE_LIMIT = 5.0
+THINGIVERSE_RATE_BURST = 10
+
+# Retries of throttled (429), failed (5xx) or dropped requests, and the
+# delays of the jittered exponential backoff between them, in seconds
+THINGIVERSE_MAX_RETRIES = 5
+THINGIVERSE_RETRY_BASE_DELAY = 1.0
+THINGIVERSE_RETRY_MAX_DELAY = 60.0
+
+# Seconds to wait for a connection to Thingiverse, and for data on an open
+# connection, before the request counts as dropped
+THINGIVERSE_CONNECT_TIMEOUT = 10.0
+THINGIVERSE_READ_TIMEOUT = 120.0
+
+# How long to wait for Thingiverse to reflect changes, in seconds
+THINGIVERSE_REFRESH_TIMEOUT = 15
+
+# Size of the chunks read from disk while streaming uploads
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# Manifest of deployed file contents, kept in the project folder
+STATE_FILE_NAME = ".threedeploy-state.json"
+
+# Write operations of a running deployment, kept if it is interrupted so
+# the next run can pick up where it stopped
+JOURNAL_FILE_NAME = ".threedeploy-journal.jsonl"
+
+# Output of --plan, written to the project folder
+PLAN_FILE_NAME = "DeployPlan.json"
+
+# Timings of a deployment, written to the project folder
+REPORT_FILE_NAME = "DeployReport.json"
+
+# Plan, timings and deployed commit of the directory destination, written
+# to the project folder
+DIRECTORY_PLAN_FILE_NAME = "DeployPlan-directory.json"
+DIRECTORY_REPORT_FILE_NAME = "DeployReport-directory.json"
+DIRECTORY_DEPLOYED_COMMIT_FILE_NAME = "DeployedCommit-directory.txt"
+
+# Log a table of phase and request timings at the end of a deployment
+REPORT_SUMMARY = False
+
+# Deploy over AsyncThingiverseClient, overlapping independent operations
+THINGIVERSE_ASYNCIO = False
+
+# Per user cache folder
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "threedeploy")
+
+# On-disk cache of Thingiverse GET responses, revalidated with ETag and
+# Last-Modified. An empty name disables the cache.
+THINGIVERSE_RESPONSE_CACHE = os.path.join(CACHE_DIR, "thingiverse-responses.json")
+
+# On-disk cache of file SHA-256 digests, valid while path, size, inode and
+# mtime_ns of a file are unchanged. An empty name disables the cache.
+FINGERPRINT_CACHE = os.path.join(CACHE_DIR, "fingerprints.json")
+
+# Number of files hashed at the same time
+FINGERPRINT_WORKERS = os.cpu_count() or 1
+
+# Pre-upload optimization of model files, results are cached by content hash
+OPTIMIZE_MODELS = False
+BUNDLE_SMALL_FILES = False
+OPTIMIZE_CACHE_DIR = os.path.join(CACHE_DIR, "optimized")
+
+# Small files of these folders are deployed as one zip with --bundle-small-files
+BUNDLE_FOLDERS = ("source", "gcode")
+BUNDLE_MAX_FILE_SIZE = 64 * 1024
+BUNDLE_FILE_NAME = "small-files.zip"
+
+# Header of converted STL files, must not start with "solid"
+BINARY_STL_HEADER = b"Binary STL converted by threedeploy"
+
+# Bytes of an ASCII STL file parsed at a time while converting it
+STL_PARSE_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Image preprocessing with --optimize-images: longest side in pixels, JPEG
+# quality and number of processes
+OPTIMIZE_IMAGES = False
+IMAGE_MAX_SIZE = 2048
+IMAGE_JPEG_QUALITY = 88
+IMAGE_WORKERS = os.cpu_count() or 1
+
+# File types deployed from each project folder, by lower case extension
+PROJECT_FILE_TYPES = {
+    "3d":       (".stl", ".obj", ".stp", ".step", ".3mf"),
+    "source":   (".fcstd", ".scad", ".f3d"),
+    "gcode":    (".gcode",),
+    "img":      (".png", ".jpg", ".bmp"),
+}
+
+# With --since-deployed-commit, only the project paths git reports as
+# changed since the commit in DEPLOYED_COMMIT_FILE_NAME (per destination)
+# are deployed
+GIT_INCREMENTAL = False
+DEPLOYED_COMMIT_FILE_NAME = "DeployedCommit.txt"
+GIT_PROJECT_PATHS = tuple(PROJECT_FILE_TYPES) + ("README.md", "thingdata.json")
+
+# --watch redeploys once files stopped changing for WATCH_DEBOUNCE seconds.
+# Without inotify, the project is scanned every WATCH_POLL_INTERVAL seconds.
+WATCH_DEBOUNCE = 1.0
+WATCH_POLL_INTERVAL = 1.0
+
 LOGGING_CONFIG_NAME = "logging.yaml"
 LOGGING_DEFAULT_FORMAT = "[%(asctime)s][%(levelname)s][%(name)s]: %(message)s"
 
@@ -44,6 +180,310 @@ def create_textfile(path, data):
                 f.write(data)
 
 
+def write_file_atomic(path, data):
+    """Replaces a textfile through a uniquely named temporary file, so that
+    concurrent runs writing the same file never mix their contents"""
+    import tempfile
+
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    f = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=folder,
+                                    prefix=os.path.basename(path) + ".",
+                                    suffix=".tmp", delete=False)
+    try:
+        with f:
+            f.write(data)
+        os.replace(f.name, path)
+    except BaseException:
+        try:
+            os.remove(f.name)
+        except OSError:
+            pass
+        raise
+
+
+def file_sha256(path):
+    """Returns the hex SHA-256 digest of a file.
+
+    The file is memory-mapped and hashed in a single call, so its pages are
+    not copied and the GIL is released for the whole file. Files that can't
+    be mapped (empty ones, or too large for the address space) are read in
+    chunks instead.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mapped, "madvise"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                digest.update(mapped)
+                return digest.hexdigest()
+        except (ValueError, OverflowError, OSError):
+            pass
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class JsonStore:
+    """Dict of entries kept in a JSON file, base of the on-disk caches.
+
+    The file is read on creation, a missing or unreadable one starts out
+    empty. Subclasses change _entries while holding _lock and set _dirty,
+    save() then writes the entries back to disk. Safe to share between
+    threads.
+    """
+
+    # Names the store in log messages
+    description = "cache"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if not isinstance(entries, dict):
+                raise ValueError("not a JSON object")
+            self._entries = entries
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable %s %s", self.description, path)
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._entries)
+            self._dirty = False
+        try:
+            write_file_atomic(self.path, data)
+        except OSError as e:
+            logger.warning("Could not write %s %s: %s", self.description,
+                           self.path, e)
+
+
+class FingerprintCache(JsonStore):
+    """On-disk store of file SHA-256 digests.
+
+    Entries are keyed by absolute path and only used while size, inode and
+    mtime_ns of the file match, so a known file costs a stat() instead of
+    being read. ProjectFiles carry these from the scan and cost nothing.
+    hash_files() hashes the unknown files of a list on a thread pool.
+    """
+
+    description = "fingerprint cache"
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self.stats = {"hits": 0, "misses": 0, "bytes_hashed": 0}
+
+    @staticmethod
+    def signature(stat) -> list:
+        """Returns size, inode and mtime_ns of a ProjectFile or stat result"""
+        if isinstance(stat, ProjectFile):
+            return [stat.size, stat.inode, stat.mtime_ns]
+        return [stat.st_size, stat.st_ino, stat.st_mtime_ns]
+
+    def lookup(self, key: str, signature: list):
+        """Returns the cached digest if the file is unchanged, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[:3] != signature:
+                return None
+            self.stats["hits"] += 1
+            return entry[3]
+
+    def sha256(self, path: str, stat=None) -> str:
+        """Returns the digest of a file, hashing it only if it changed"""
+        if stat is None:
+            stat = os.stat(path)
+        key = os.path.abspath(path)
+        signature = self.signature(stat)
+        digest = self.lookup(key, signature)
+        if digest is not None:
+            return digest
+
+        digest = file_sha256(path)
+        with self._lock:
+            self._entries[key] = signature + [digest]
+            self.stats["misses"] += 1
+            self.stats["bytes_hashed"] += signature[0]
+            self._dirty = True
+        return digest
+
+    def hash_files(self, files) -> None:
+        """Hashes the ProjectFiles not known yet, FINGERPRINT_WORKERS at once"""
+        pending = [file for file in files
+                   if self.lookup(os.path.abspath(file.path),
+                                  self.signature(file)) is None]
+        if not pending:
+            return
+
+        logger.info("Hashing %d files (%d bytes)", len(pending),
+                    sum(file.size for file in pending))
+        # Largest first, so one large file does not finish last on its own
+        pending.sort(key=lambda file: -file.size)
+        workers = max(1, min(FINGERPRINT_WORKERS, len(pending)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(lambda file: self.sha256(file.path, file),
+                                  pending):
+                pass
+
+
+_fingerprint_cache = None
+_fingerprint_cache_lock = threading.Lock()
+
+
+def fingerprint_cache():
+    """Returns the FingerprintCache of FINGERPRINT_CACHE, None if disabled.
+
+    All deployments of a process share it, it is loaded on first use.
+    """
+    global _fingerprint_cache
+    if not FINGERPRINT_CACHE:
+        return None
+    with _fingerprint_cache_lock:
+        if _fingerprint_cache is None or _fingerprint_cache.path != FINGERPRINT_CACHE:
+            _fingerprint_cache = FingerprintCache(FINGERPRINT_CACHE)
+        return _fingerprint_cache
+
+
+def file_fingerprint(path, stat=None):
+    """Returns the hex SHA-256 digest of a file, from the fingerprint cache
+    if it is unchanged. stat may be a ProjectFile or stat result of path."""
+    cache = fingerprint_cache()
+    if cache is None:
+        return file_sha256(path)
+    return cache.sha256(path, stat)
+
+
+def hash_project_files(files):
+    """Fingerprints the ProjectFiles not cached yet, in parallel"""
+    cache = fingerprint_cache()
+    if cache is not None:
+        cache.hash_files(files)
+
+
+def save_fingerprint_cache():
+    cache = fingerprint_cache()
+    if cache is not None:
+        cache.save()
+
+
+def load_deploy_state(project_path, thing_id):
+    """Loads the manifest of deployed files for the given thing.
+
+    Returns an empty manifest if none exists or if it was written for a
+    different thing.
+    """
+    empty_state = {"thingiverse_id": thing_id, "files": {}}
+    statepath = os.path.join(project_path, STATE_FILE_NAME)
+    if not os.path.isfile(statepath):
+        return empty_state
+
+    try:
+        with open(statepath, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except ValueError:
+        logger.warning("Ignoring unreadable %s", STATE_FILE_NAME)
+        return empty_state
+
+    if str(state.get("thingiverse_id")) != str(thing_id):
+        logger.info("%s belongs to a different thing, ignoring it", STATE_FILE_NAME)
+        return empty_state
+
+    state.setdefault("files", {})
+    return state
+
+
+def save_deploy_state(project_path, state):
+    """Writes the manifest of deployed files, a killed run leaves the
+    previous one in place"""
+    write_file_atomic(os.path.join(project_path, STATE_FILE_NAME),
+                      json.dumps(state, indent=4, sort_keys=True))
+
+
+class DeployJournal:
+    """Append-only record of the completed write operations of a deployment.
+
+    Every operation is one JSON line, flushed to disk before record()
+    returns, so the journal survives a killed process. Safe to share
+    between threads.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, **fields) -> None:
+        line = json.dumps(dict(fields, op=operation), sort_keys=True)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def clear(self) -> None:
+        """Removes the journal after a deployment completed"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def load_deploy_journal(project_path):
+    """Returns the operations journaled by an interrupted deployment.
+
+    A line cut short by the interruption is skipped.
+    """
+    journalpath = os.path.join(project_path, JOURNAL_FILE_NAME)
+    entries = []
+    try:
+        with open(journalpath, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    logger.warning("Skipping incomplete line in %s", JOURNAL_FILE_NAME)
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def wait_for(fetch, condition, timeout, first_delay=0.25, max_delay=4.0):
+    """Calls fetch() until condition(result) holds or timeout seconds passed.
+
+    The delay between attempts starts at first_delay and doubles up to
+    max_delay. The first attempt is made immediately. Returns the last result
+    and whether the condition was met.
+    """
+    deadline = time.monotonic() + timeout
+    delay = first_delay
+    while True:
+        result = fetch()
+        if condition(result):
+            return result, True
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return result, False
+
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
 def verbose_request_logging(request_type: str, **kwargs) -> None:
     if "headers" in kwargs:
         logger.debug("%s headers: %s", request_type, kwargs["headers"])
@@ -55,204 +495,1122 @@ def verbose_request_logging(request_type: str, **kwargs) -> None:
         logger.debug("%s data: %s", request_type, kwargs["data"])
 
 
-def get(url: str, **kwargs) -> Response:
-    verbose_request_logging("GET", **kwargs)
-    return requests.get(url, **kwargs)
+class MultipartFileStream:
+    """Streams a multipart/form-data body containing a single file from disk.
+
+    Only the form fields and part headers are kept in memory, the file itself
+    is read in UPLOAD_CHUNK_SIZE pieces while requests sends the body, so
+    memory use does not depend on the file size. Pass an instance as `data`
+    together with its content_type header. progress(bytes_sent, total) is
+    called after every chunk of the file was handed out.
+    """
+
+    def __init__(self, fields: dict, file_field: str, path: str,
+                 filename: str = None, progress=None) -> None:
+        boundary = uuid.uuid4().hex
+        self.content_type = "multipart/form-data; boundary=" + boundary
+
+        if filename is None:
+            filename = os.path.basename(path)
+
+        preamble = []
+        for name, value in fields.items():
+            preamble.append(("--%s\r\n"
+                             "Content-Disposition: form-data; name=\"%s\"\r\n\r\n"
+                             "%s\r\n" % (boundary, name, value)).encode("utf-8"))
+        preamble.append(("--%s\r\n"
+                         "Content-Disposition: form-data; name=\"%s\"; filename=\"%s\"\r\n"
+                         "Content-Type: application/octet-stream\r\n\r\n"
+                         % (boundary, file_field, filename)).encode("utf-8"))
+        self._preamble = b"".join(preamble)
+        self._epilogue = ("\r\n--%s--\r\n" % boundary).encode("utf-8")
+
+        self.file_size = os.path.getsize(path)
+        self.len = len(self._preamble) + self.file_size + len(self._epilogue)
+
+        self._path = path
+        self._file = None
+        self._chunks = None
+        self._progress = progress
+        self.rewind()
+
+    def __len__(self) -> int:
+        return self.len
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def rewind(self) -> None:
+        """Restarts the body from the beginning, e.g. to resend it"""
+        self.close()
+        self._chunks = self._generate_chunks()
+        self._buffer = b""
+        self._offset = 0
+
+    def _generate_chunks(self):
+        yield self._preamble
+        self._file = open(self._path, "rb")
+        file_sent = 0
+        for chunk in iter(lambda: self._file.read(UPLOAD_CHUNK_SIZE), b""):
+            file_sent += len(chunk)
+            if self._progress is not None:
+                self._progress(file_sent, self.file_size)
+            yield chunk
+        self.close()
+        yield self._epilogue
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.len
+
+        pieces = []
+        while size > 0:
+            if self._offset >= len(self._buffer):
+                self._buffer = next(self._chunks, b"")
+                self._offset = 0
+                if not self._buffer:
+                    break
+            piece = self._buffer[self._offset:self._offset + size]
+            self._offset += len(piece)
+            size -= len(piece)
+            pieces.append(piece)
+
+        return b"".join(pieces)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RateLimiter:
+    """Token bucket limiting how many requests are sent per second.
+
+    Safe to share between threads. pause() holds back every request until a
+    point in time, e.g. when the server asked to retry later.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Blocks until a request may be sent, returns the seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = self._paused_until - now
+                if delay <= 0:
+                    if self.rate <= 0:
+                        return waited
+                    self._tokens = min(self.burst, self._tokens
+                                       + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until,
+                                     time.monotonic() + seconds)
+
+
+class ResponseCache(JsonStore):
+    """On-disk store of GET responses that carry an ETag or Last-Modified.
+
+    Entries are keyed by URL and a hash of the API token, so different
+    accounts never see each other's responses. lookup() returns the headers
+    for a conditional request, revalidated() turns a 304 answer back into
+    the cached 200 response. Every entry belongs to the Thing in its URL and
+    invalidate() drops all entries of a Thing after it was written to.
+    """
+
+    THING_ID = re.compile(r"/things/(\d+)")
+
+    description = "response cache"
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self.stats = {"hits": 0, "misses": 0, "bytes_saved": 0}
+
+    @staticmethod
+    def key(url: str, authorization) -> str:
+        token = hashlib.sha256((authorization or "").encode("utf-8")).hexdigest()
+        return token[:16] + " " + url
+
+    def lookup(self, key: str) -> dict:
+        """Returns the validator headers for a request, empty if not cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, key: str, url: str, response: "Response") -> None:
+        """Caches a 200 response if it can be revalidated, counts a miss"""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        with self._lock:
+            self.stats["misses"] += 1
+            if not etag and not last_modified:
+                self._entries.pop(key, None)
+                return
+            match = self.THING_ID.search(url)
+            self._entries[key] = {
+                "etag":          etag,
+                "last_modified": last_modified,
+                "thing_id":      match.group(1) if match else None,
+                "content_type":  response.headers.get("Content-Type"),
+                "body":          response.content.decode("utf-8", "replace")}
+            self._dirty = True
+
+    def revalidated(self, key: str, response: "Response"):
+        """Returns the cached response for a 304 answer, None if not cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            body = entry["body"].encode("utf-8")
+            self.stats["hits"] += 1
+            self.stats["bytes_saved"] += len(body)
+
+        from requests import Response
+        from requests.structures import CaseInsensitiveDict
+
+        cached = Response()
+        cached.status_code = 200
+        cached.reason = "OK"
+        cached._content = body
+        cached.encoding = "utf-8"
+        cached.headers = CaseInsensitiveDict(response.headers)
+        if entry.get("content_type"):
+            cached.headers["Content-Type"] = entry["content_type"]
+        cached.url = response.url
+        cached.request = response.request
+        cached.elapsed = response.elapsed
+        return cached
+
+    def invalidate(self, url: str) -> None:
+        """Drops every cached response of the Thing a URL belongs to"""
+        match = self.THING_ID.search(url)
+        if match is None:
+            return
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if entry.get("thing_id") == match.group(1)]
+            for key in stale:
+                del self._entries[key]
+            self._dirty = self._dirty or bool(stale)
+
+
+class DeployReport:
+    """Collects the phase timings and HTTP calls of one deployment.
+
+    phase() ends the running phase and starts the next one, finish() ends
+    the last. Calls may be recorded from several threads.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.phases = []
+        self.calls = []
+        self._phase_name = None
+        self._phase_start = None
+        self._lock = threading.Lock()
+
+    def phase(self, name: str) -> None:
+        self.finish()
+        self._phase_name = name
+        self._phase_start = time.monotonic()
+
+    def finish(self) -> None:
+        if self._phase_name is not None:
+            self.phases.append({"name":    self._phase_name,
+                                "seconds": round(time.monotonic()
+                                                 - self._phase_start, 6)})
+            self._phase_name = None
+
+    def branch(self) -> "DeployReport":
+        """Returns a new report continuing from the phases finished so far"""
+        report = DeployReport()
+        report.started = self.started
+        report.phases = list(self.phases)
+        return report
+
+    def record_call(self, method: str, url: str, status, bytes_sent: int,
+                    bytes_received: int, seconds: float) -> None:
+        with self._lock:
+            self.calls.append({"method":         method,
+                               "endpoint":       url,
+                               "status":         status,
+                               "bytes_sent":     bytes_sent,
+                               "bytes_received": bytes_received,
+                               "seconds":        round(seconds, 6)})
+
+    def call_totals(self):
+        """Returns count, time and bytes per method and endpoint, IDs elided"""
+        totals = {}
+        with self._lock:
+            calls = list(self.calls)
+        for call in calls:
+            endpoint = re.sub(r"/\d+", "/{id}", call["endpoint"].split("?")[0])
+            total = totals.setdefault((call["method"], endpoint),
+                                      {"method":   call["method"],
+                                       "endpoint": endpoint,
+                                       "count":    0,
+                                       "seconds":  0.0,
+                                       "bytes":    0})
+            total["count"]   += 1
+            total["seconds"] += call["seconds"]
+            total["bytes"]   += call["bytes_sent"] + call["bytes_received"]
+        return list(totals.values())
+
+    def to_dict(self) -> dict:
+        return {"started":       datetime.fromtimestamp(
+                                    self.started, timezone.utc).isoformat(),
+                "total_seconds": round(sum(phase["seconds"]
+                                           for phase in self.phases), 6),
+                "phases":        self.phases,
+                "call_totals":   self.call_totals(),
+                "calls":         self.calls}
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.to_dict(), indent=4))
+
+    def log_summary(self) -> None:
+        logger.info("----------------------------------------")
+        logger.info("%-24s %9s", "Phase", "Seconds")
+        for phase in self.phases:
+            logger.info("%-24s %9.3f", phase["name"], phase["seconds"])
+        logger.info("%-6s %-40s %5s %9s %10s", "Method", "Endpoint", "Count",
+                    "Seconds", "Bytes")
+        for total in sorted(self.call_totals(), key=lambda t: -t["seconds"]):
+            logger.info("%-6s %-40s %5d %9.3f %10d", total["method"],
+                        total["endpoint"], total["count"], total["seconds"],
+                        total["bytes"])
+        logger.info("----------------------------------------")
 
 
-def post(url: str, **kwargs) -> Response:
-    verbose_request_logging("POST", **kwargs)
-    return requests.post(url, **kwargs)
+def request_body_size(kwargs) -> int:
+    """Returns the size of the body a request will send, if known"""
+    body = kwargs.get("data")
+    if body is None:
+        return 0
+    try:
+        return len(body)
+    except TypeError:
+        return 0
 
 
-def patch(url: str, **kwargs) -> Response:
-    verbose_request_logging("PATCH", **kwargs)
-    return requests.patch(url, **kwargs)
+def retry_after_seconds(response: "Response"):
+    """Returns the delay requested by a Retry-After header, or None"""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class ThingiverseClient:
+    """Owns the pooled HTTP session used for every Thingiverse request.
+
+    Paths starting with "/" are resolved against THINGIVERSE_API_URL, absolute
+    URLs (upload storage, finalize redirects) are used as they are.
+
+    Requests to the API pass through a RateLimiter. Throttled requests (429)
+    are retried for every method, server errors and dropped connections
+    only for idempotent methods. Retries back off exponentially with jitter
+    unless the server sends Retry-After. A 429/5xx response that is not
+    retried raises requests.HTTPError. Counters are kept in stats.
+
+    Requests time out after timeout, a (connect, read) tuple in seconds,
+    unless they pass their own.
+    """
+
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+    def __init__(self, api_token: str, pool_size: int = None,
+                 limiter: RateLimiter = None, session=None,
+                 cache: ResponseCache = None, timeout: tuple = None) -> None:
+        if pool_size is None:
+            pool_size = max(THINGIVERSE_POOL_SIZE, THINGIVERSE_UPLOAD_WORKERS)
+        if limiter is None:
+            limiter = RateLimiter(THINGIVERSE_RATE_LIMIT, THINGIVERSE_RATE_BURST)
+
+        if timeout is None:
+            timeout = (THINGIVERSE_CONNECT_TIMEOUT, THINGIVERSE_READ_TIMEOUT)
+
+        self.api_url = THINGIVERSE_API_URL
+        self.limiter = limiter
+        self.timeout = timeout
+        self.report = None
+        self.journal = None
+        self.stats = {"requests":         0,
+                      "retries":          0,
+                      "throttle_waits":   0,
+                      "throttle_seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+        # A shared session is owned, and closed, by the client it came from
+        self._owns_session = session is None
+        self.cache = cache
+        if session is not None:
+            self.session = session
+            return
+
+        if cache is None and THINGIVERSE_RESPONSE_CACHE:
+            self.cache = ResponseCache(THINGIVERSE_RESPONSE_CACHE)
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": "Bearer " + api_token})
+
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._owns_session:
+            self.session.close()
+            if self.cache is not None:
+                self.cache.save()
+
+    def fork(self):
+        """Returns a client sharing this session and rate limiter.
+
+        The new client keeps its own stats, e.g. to count the requests of a
+        single project in batch mode.
+        """
+        return ThingiverseClient(None, limiter=self.limiter, session=self.session,
+                                 cache=self.cache, timeout=self.timeout)
+
+    def url(self, path: str) -> str:
+        if path.startswith("/"):
+            return self.api_url + path
+        return path
+
+    def endpoint(self, url: str) -> str:
+        """Returns API URLs as a path, other URLs unchanged"""
+        if url.startswith(self.api_url):
+            return url[len(self.api_url):]
+        return url
+
+    def count(self, name: str, amount=1) -> None:
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def journal_operation(self, operation: str, **fields) -> None:
+        """Records a completed write operation if a journal is attached"""
+        if self.journal is not None:
+            self.journal.record(operation, **fields)
+
+    def request(self, method: str, path: str, **kwargs) -> "Response":
+        import requests
+
+        verbose_request_logging(method, **kwargs)
+        kwargs.setdefault("timeout", self.timeout)
+        url = self.url(path)
+        idempotent = method in self.IDEMPOTENT_METHODS
+
+        # Known API responses are only transferred again if they changed,
+        # writes make the cached responses of their Thing stale
+        cache_key = None
+        invalidates = False
+        if self.cache is not None and url.startswith(self.api_url):
+            if method == "GET":
+                cache_key = self.cache.key(
+                             url, self.session.headers.get("Authorization"))
+                kwargs["headers"] = dict(kwargs.get("headers") or {},
+                                         **self.cache.lookup(cache_key))
+            else:
+                invalidates = True
+
+        attempt = 0
+        while True:
+            if url.startswith(self.api_url):
+                waited = self.limiter.acquire()
+                if waited > 0:
+                    self.count("throttle_waits")
+                    self.count("throttle_seconds", waited)
+
+            self.count("requests")
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if invalidates:
+                    self.cache.invalidate(url)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if invalidates:
+                    self.cache.invalidate(url)
+                if self.report is not None:
+                    self.report.record_call(method, self.endpoint(url), None,
+                                            request_body_size(kwargs), 0,
+                                            time.monotonic() - start)
+                if not idempotent or attempt >= THINGIVERSE_MAX_RETRIES:
+                    raise
+                reason = type(e).__name__
+                delay = self.backoff(attempt)
+            else:
+                if self.report is not None:
+                    self.report.record_call(method, self.endpoint(url),
+                                            response.status_code,
+                                            request_body_size(kwargs),
+                                            len(response.content),
+                                            time.monotonic() - start)
+                status = response.status_code
+                if cache_key is not None:
+                    if status == 304:
+                        cached = self.cache.revalidated(cache_key, response)
+                        if cached is not None:
+                            return cached
+                        # Invalidated in the meantime, fetch it in full
+                        kwargs["headers"] = {
+                            name: value for name, value in kwargs["headers"].items()
+                            if name not in ("If-None-Match", "If-Modified-Since")}
+                        continue
+                    if status == 200:
+                        self.cache.store(cache_key, url, response)
+                if status != 429 and status < 500:
+                    return response
+                if ((status >= 500 and not idempotent)
+                        or attempt >= THINGIVERSE_MAX_RETRIES):
+                    response.raise_for_status()
+                reason = "HTTP %d" % status
+                delay = retry_after_seconds(response)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                if status == 429:
+                    # Hold back all other requests on this client, too
+                    self.limiter.pause(delay)
+
+            attempt += 1
+            self.count("retries")
+            logger.info("%s %s failed (%s), retry %d of %d in %.1f seconds",
+                        method, url, reason, attempt, THINGIVERSE_MAX_RETRIES, delay)
+            time.sleep(delay)
+
+            # Streamed bodies need to start over
+            body = kwargs.get("data")
+            if hasattr(body, "rewind"):
+                body.rewind()
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """Returns a jittered exponential delay for a retry"""
+        limit = min(THINGIVERSE_RETRY_MAX_DELAY,
+                    THINGIVERSE_RETRY_BASE_DELAY * 2 ** attempt)
+        return random.uniform(limit / 2, limit)
+
+    def get(self, path: str, **kwargs) -> "Response":
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> "Response":
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path: str, **kwargs) -> "Response":
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> "Response":
+        return self.request("DELETE", path, **kwargs)
+
+
+class AsyncThingiverseClient:
+    """Asyncio front end to a ThingiverseClient.
+
+    Each request runs the blocking client in a worker thread, so session,
+    rate limiter, retries and report stay shared with the synchronous code
+    and no asyncio HTTP library is needed. At most THINGIVERSE_API_WORKERS
+    API requests and THINGIVERSE_UPLOAD_WORKERS file transfers run at once.
+    """
+
+    def __init__(self, client: ThingiverseClient) -> None:
+        import asyncio
+
+        self.client = client
+        self._api_slots = asyncio.Semaphore(THINGIVERSE_API_WORKERS)
+        self._upload_slots = asyncio.Semaphore(THINGIVERSE_UPLOAD_WORKERS)
+        self._executor = ThreadPoolExecutor(
+                          max_workers=THINGIVERSE_API_WORKERS
+                                      + THINGIVERSE_UPLOAD_WORKERS)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    async def run(self, function, *args, **kwargs):
+        """Runs a blocking function on the worker threads"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+                      self._executor, functools.partial(function, *args, **kwargs))
+
+    async def run_api(self, function, *args, **kwargs):
+        """Runs a blocking function sending a single API request"""
+        async with self._api_slots:
+            return await self.run(function, *args, **kwargs)
+
+    async def request(self, method: str, path: str, **kwargs) -> "Response":
+        return await self.run_api(self.client.request, method, path, **kwargs)
+
+    async def get(self, path: str, **kwargs) -> "Response":
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> "Response":
+        return await self.request("POST", path, **kwargs)
+
+    async def patch(self, path: str, **kwargs) -> "Response":
+        return await self.request("PATCH", path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> "Response":
+        return await self.request("DELETE", path, **kwargs)
 
+    async def get_json(self, path: str):
+        return json.loads((await self.get(path)).text)
 
-def delete(url: str, **kwargs) -> Response:
-    verbose_request_logging("DELETE", **kwargs)
-    return requests.delete(url, **kwargs)
+    async def upload_file(self, file, thingdata):
+        """Runs thingiverse_upload_file, returning its result"""
+        async with self._upload_slots:
+            return await self.run(thingiverse_upload_file, file, thingdata,
+                                  self.client)
 
 
 ########## Thingiverse
-def thingiverse_deploy_files(access_path, files, whitelist, thingdata, headers):
-    """Deploys files.."""
-
-    ########## File checks
-
-    existing_files = json.loads(get("https://api.thingiverse.com/things/"
-                            + str(thingdata["thingiverse_id"])
-                            + access_path, headers=headers).text)
-
-
-    # check for upload vs patch
-    files_to_upload = []
-    files_to_patch  = []
-    files_to_delete = []
-
-    for localfile in files:
-        upload_required = True
+# Metadata fields that the API reports in the same format as it accepts them
+THINGIVERSE_COMPARABLE_FIELDS = ("name", "is_wip", "tags")
+
+
+def thingiverse_metadata(thingdata):
+    """Returns the Thing metadata from thingdata.json, as sent to the API"""
+    return {"name":           thingdata["name"],
+            "license":        thingdata["thingiverse_license"],
+            "category":       thingdata["thingiverse_category"],
+            "description":    thingdata["thingiverse_description"],
+            "instructions":   thingdata["thingiverse_instructions"],
+            "is_wip":         thingdata["thingiverse_is_wip"],
+            "tags":           thingdata["tags"]}
+
+
+def thingiverse_remote_metadata(thing):
+    """Returns the comparable metadata fields of a Thing returned by the API"""
+    remote = {}
+    if "name" in thing:
+        remote["name"] = thing["name"]
+    if "is_wip" in thing:
+        remote["is_wip"] = bool(thing["is_wip"])
+    if "tags" in thing:
+        remote["tags"] = [tag["name"] if isinstance(tag, dict) else tag
+                          for tag in thing["tags"]]
+    return remote
+
+
+def thingiverse_tag_set(tags):
+    """Returns tags as Thingiverse treats them: unordered, case-insensitive
+    and without surrounding whitespace or duplicates"""
+    return set(tag.strip().lower() for tag in tags)
+
+
+def thingiverse_metadata_equal(field, value, other):
+    if field == "tags":
+        return thingiverse_tag_set(value) == thingiverse_tag_set(other)
+    return value == other
+
+
+def thingiverse_diff_metadata(thingdata, thing, state):
+    """Returns the metadata fields that need to be sent to Thingiverse.
+
+    A field differs if it changed since it was last deployed, as recorded in
+    the deploy state, or if Thingiverse reports a different value for one of
+    THINGIVERSE_COMPARABLE_FIELDS. Tags are compared as a set, see
+    thingiverse_tag_set.
+    """
+    local    = thingiverse_metadata(thingdata)
+    deployed = state.get("metadata", {})
+    remote   = thingiverse_remote_metadata(thing)
+
+    diff = {}
+    for field, value in local.items():
+        if (field not in deployed or
+                not thingiverse_metadata_equal(field, value, deployed[field])):
+            diff[field] = value
+        elif (field in remote and
+                not thingiverse_metadata_equal(field, value, remote[field])):
+            diff[field] = value
+    return diff
+
+
+def thingiverse_metadata_reflected(thing, params):
+    """Returns True if the Thing reports the comparable fields of params.
+
+    Thingiverse may reorder tags or change their case, so tags are compared
+    as a set.
+    """
+    remote = thingiverse_remote_metadata(thing)
+    for field in THINGIVERSE_COMPARABLE_FIELDS:
+        if field not in params or field not in remote:
+            continue
+        if not thingiverse_metadata_equal(field, params[field], remote[field]):
+            return False
+    return True
+
+
+def thingiverse_image_ranks(images):
+    """Returns the rank of each image, based on its file name.
+
+    Images named like "RR-*" get rank RR, all others are ranked from 100
+    onwards in the order they are given.
+    """
+    ranks = []
+    number_of_invalid_filenames = 0
+    for image in images:
+        if re.match("[0-9][0-9]-+", image["name"]) is not None:
+            ranks.append(int(image["name"][:2]))
+        else:
+            ranks.append(100 + number_of_invalid_filenames)
+            number_of_invalid_filenames += 1
+    return ranks
+
+
+def plan_file_entry(localfile):
+    """Returns the JSON serializable plan entry of a ProjectFile"""
+    return {"name": localfile.name,
+            "path": localfile.path,
+            "size": localfile.size}
+
+
+def thingiverse_compare_files(access_path, files, existing_files, whitelist, deployed,
+                              scope=None):
+    """Matches local ProjectFiles against the remote listing of access_path.
+
+    Returns a dict listing the local files to "upload", the {"local",
+    "remote"} pairs to "replace", the remote files to "delete" and, for
+    "/files", the manifest records of up to date files to "keep".
+
+    For "/files", the deploy state manifest `deployed` decides whether a
+    remote file is outdated by comparing content hashes. Files without a
+    manifest entry fall back to comparing timestamps. Files to upload carry
+    the hash they had when planned, which is what the manifest records, so
+    an edit made during the upload is uploaded by the next deployment.
+
+    With a scope of file names, files of other names are neither compared
+    nor deleted, on either side.
+    """
+    if scope is not None:
+        files = [localfile for localfile in files if localfile.name in scope]
+        existing_files = [remotefile for remotefile in existing_files
+                          if remotefile["name"] in scope]
+
+    files_to_upload  = []
+    files_to_replace = []
+    files_to_delete  = []
+    files_to_keep    = []
+
+    # Index both sides by name. Like a linear search, the first remote file
+    # of a name is the one matched, unless the manifest knows another one.
+    # Both versions of a file are online if a replacement was interrupted.
+    remote_by_name = {}
+    for remotefile in existing_files:
+        remote_by_name.setdefault(remotefile["name"], remotefile)
+    if access_path == "/files":
         for remotefile in existing_files:
-            # If a matching file is found on remote, append it onto patch list.
-            # This will include id etc.
-            if remotefile["name"] == localfile["name"]:
-                upload_required = False
-
-                # Only check timestamps for file types, not images
-                if access_path == "/files":
-                    # The timestamp from strptime is naive and assumes my
-                    # timezone, which I need to strip in a second step
-                    naive_upload_timestamp = datetime.strptime(
-                                                remotefile["date"],
-                                                "%Y-%m-%d %H:%M:%S")
-
-                    upload_timestamp =  datetime.timestamp(
-                                          naive_upload_timestamp.replace(
-                                              tzinfo=timezone.utc))
-
-                    logger.info("Checking timestamps for existing file:")
-                    logger.info(remotefile["name"])
-                    if localfile["date"] > upload_timestamp:
-                        logger.info("Replacing file")
-                        files_to_patch.append(remotefile)
-                        files_to_delete.append(remotefile)
-                        files_to_upload.append(localfile)
-                    else:
-                        logger.info("Keeping uploaded version")
-
-                # Replacing images is not enabled anymore.
-                #elif access_path == "/images":
-                #    logger.info("Replacing existing image: " + localfile["name"])
-                #    files_to_patch.append(remotefile)
-                #    files_to_delete.append(remotefile)
-                #    files_to_upload.append(localfile)
-                break
-        if upload_required:
-            files_to_upload.append(localfile)
+            record = deployed.get(remotefile["name"])
+            if record is not None and record["id"] == remotefile["id"]:
+                remote_by_name[remotefile["name"]] = remotefile
 
+    keep_names = set(localfile.name for localfile in files)
+    if access_path == "/images":
+        # also keep auto generated images by thingiverse, which is 
+        # always "<NameOfExisting3dFile>.png", pulled from whitelist
+        keep_names.update(os.path.splitext(whitelistfile.name)[0] + ".png"
+                          for whitelistfile in whitelist)
 
-    # check for files to delete
+    for localfile in files:
+        # If a matching file is found on remote, check if it needs to be
+        # replaced. The remote entry includes the id etc.
+        remotefile = remote_by_name.get(localfile.name)
+        if access_path != "/files":
+            # Replacing images is not enabled anymore.
+            if remotefile is None:
+                files_to_upload.append(plan_file_entry(localfile))
+            continue
+
+        sha256 = file_fingerprint(localfile.path, localfile)
+        if remotefile is None:
+            files_to_upload.append(dict(plan_file_entry(localfile),
+                                        sha256=sha256))
+            continue
+
+        # Only check contents for file types, not images.
+        record = deployed.get(localfile.name)
+
+        if record is not None and record["id"] == remotefile["id"]:
+            logger.info("Checking contents for existing file:")
+            logger.info(remotefile["name"])
+            outdated = (record["sha256"] != sha256 or
+                        record["size"] != localfile.size)
+        else:
+            # The timestamp from strptime is naive and assumes my
+            # timezone, which I need to strip in a second step
+            naive_upload_timestamp = datetime.strptime(
+                                        remotefile["date"],
+                                        "%Y-%m-%d %H:%M:%S")
+
+            upload_timestamp =  datetime.timestamp(
+                                  naive_upload_timestamp.replace(
+                                      tzinfo=timezone.utc))
+
+            logger.info("Checking timestamps for existing file:")
+            logger.info(remotefile["name"])
+            outdated = localfile.mtime > upload_timestamp
+
+        if outdated:
+            logger.info("Replacing file")
+            files_to_replace.append({
+                "local":  dict(plan_file_entry(localfile), sha256=sha256),
+                "remote": {"id":   remotefile["id"],
+                           "name": remotefile["name"]}})
+        else:
+            logger.info("Keeping uploaded version")
+            files_to_keep.append({
+                "name":   localfile.name,
+                "id":     remotefile["id"],
+                "sha256": sha256,
+                "size":   localfile.size})
+
+    # check for files to delete, if no local file (or model preview) has
+    # their name, or if they are outdated copies of a deployed file
     for remotefile in existing_files:
-        deletion_required = True
+        current = remote_by_name[remotefile["name"]]
+        record = deployed.get(remotefile["name"])
+        outdated_copy = (access_path == "/files"
+                         and remotefile["id"] != current["id"]
+                         and record is not None
+                         and record["id"] == current["id"])
+        if remotefile["name"] not in keep_names or outdated_copy:
+            files_to_delete.append({"id":   remotefile["id"],
+                                    "name": remotefile["name"]})
+
+    return {"upload":  files_to_upload,
+            "replace": files_to_replace,
+            "delete":  files_to_delete,
+            "keep":    files_to_keep}
+
+
+def thingiverse_deploy_files(access_path, changes, thingdata, client, state=None):
+    """Uploads and deletes files as planned by thingiverse_compare_files.
+
+    Uploads go first: the outdated version of a replaced file is only
+    deleted once its replacement is finalized, so the Thing never lacks a
+    file and a failed upload leaves the old version in place. Deletions of
+    files that are gone locally run while the uploads are in progress.
+
+    For "/files", the deploy state manifest is updated in place with every
+    file that is kept or uploaded.
+    """
+    if state is None:
+        state = {"files": {}}
+    deployed = state["files"]
+
+    files_to_delete, files_to_upload = thingiverse_file_operations(
+                                        access_path, changes, deployed)
+
+    client.report.phase("transfer " + access_path)
+    for file, replaced in files_to_upload:
+        logger.info("Queueing upload of %s", file["name"])
+
+    def upload(file, replaced):
+        finalize_response, log_records = thingiverse_upload_file(file, thingdata,
+                                                                 client)
+        thingiverse_journal_upload(client, access_path, file, replaced,
+                                   finalize_response, thingdata)
+        if replaced is not None:
+            log_records.append((logging.INFO, "Deleting replaced version of %s",
+                                (replaced["name"],)))
+            thingiverse_delete_file(access_path, replaced, thingdata, client)
+        return finalize_response, log_records
+
+    # Transfers run concurrently, but results and their log output are
+    # handled in the order of files_to_upload to keep runs reproducible
+    workers = max(1, min(THINGIVERSE_UPLOAD_WORKERS, len(files_to_upload)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda operation: upload(*operation),
+                               files_to_upload)
+
+        ########## File deletions
+        for file in files_to_delete:
+            logger.info("Starting deletion of %s", file["name"])
+            thingiverse_delete_file(access_path, file, thingdata, client)
+            thingiverse_record_deletion(deployed, file)
+
+        ########## File uploads
+        for (file, replaced), (finalize_response, log_records) in zip(
+                                                    files_to_upload, results):
+            log_upload_records(file, log_records)
+
+            if replaced is not None:
+                thingiverse_record_deletion(deployed, replaced)
+            if access_path == "/files":
+                thingiverse_record_upload(deployed, file, finalize_response)
+
+
+def thingiverse_file_operations(access_path, changes, deployed):
+    """Splits planned changes into files to delete and files to upload.
+
+    Files to upload come as (local file, replaced remote file or None).
+    Kept model files are recorded in the deployed manifest right away.
+    """
+    if access_path == "/files":
+        for record in changes["keep"]:
+            deployed[record["name"]] = {"id":     record["id"],
+                                        "sha256": record["sha256"],
+                                        "size":   record["size"]}
+
+    files_to_delete = list(changes["delete"])
+    files_to_upload = ([(file, None) for file in changes["upload"]]
+                       + [(pair["local"], pair["remote"])
+                          for pair in changes["replace"]])
+    return files_to_delete, files_to_upload
+
+
+def thingiverse_delete_file(access_path, file, thingdata, client):
+    """Deletes a single remote file or image"""
+    deletion_response = json.loads(client.delete("/things/"
+                            + str(thingdata["thingiverse_id"])
+                            + access_path + "/"
+                            + str(file["id"])).text)
+
+    #logger.info(json.dumps(deletion_response, indent=4))
+
+    client.journal_operation("delete", thing=thingdata["thingiverse_id"],
+                             kind=access_path, id=file["id"], name=file["name"])
+
+
+def thingiverse_journal_upload(client, access_path, file, replaced,
+                               finalize_response, thingdata):
+    """Journals a finalized upload, with what the manifest needs to know"""
+    fields = {"thing": thingdata["thingiverse_id"],
+              "kind":  access_path,
+              "name":  file["name"],
+              "id":    finalize_response["id"],
+              "size":  file["size"]}
+    if access_path == "/files":
+        # Hashed when planned, the file may have changed since
+        fields["sha256"] = file["sha256"]
+    if replaced is not None:
+        fields["replaces"] = replaced["id"]
+    client.journal_operation("upload", **fields)
+
+
+def thingiverse_record_deletion(deployed, file):
+    """Drops a deleted remote file from the deployed manifest"""
+    record = deployed.get(file["name"])
+    if record is not None and record["id"] == file["id"]:
+        del deployed[file["name"]]
+
+
+def thingiverse_record_upload(deployed, file, finalize_response):
+    """Adds an uploaded file to the deployed manifest"""
+    deployed[file["name"]] = {
+        "id":     finalize_response["id"],
+        "sha256": file["sha256"],
+        "size":   file["size"]}
+
+
+def log_upload_records(file, log_records):
+    """Outputs the log records collected by thingiverse_upload_file"""
+    logger.info("Starting upload of %s", file["name"])
+    for level, msg, args in log_records:
+        logger.log(level, msg, *args)
+    logger.info("Finished upload of %s", file["name"])
+
+
+def log_upload_progress(name):
+    """Returns an upload progress callback logging every 10% for a file"""
+    last_step = [-1]
+
+    def progress(bytes_sent, total):
+        step = 10 if total == 0 else bytes_sent * 10 // total
+        if step != last_step[0]:
+            last_step[0] = step
+            logger.debug("Uploading %s: %d of %d bytes sent", name, bytes_sent, total)
+
+    return progress
+
+
+def thingiverse_upload_file(file, thingdata, client, progress=log_upload_progress):
+    """Runs the three step transfer of a single file to Thingiverse.
+
+    Log records are collected instead of emitted, so that concurrent uploads
+    can be reported in a deterministic order by the caller. progress is a
+    factory taking the file name and returning the callback handed to
+    MultipartFileStream.
+    """
+    log_records = []
+
+    # open up transfer
+    log_records.append((logging.INFO, "Opening transfer", ()))
+    params = {"filename": file["name"]}
+    upload_creds = json.loads(
+                    client.post("/things/"
+                                    + str(thingdata["thingiverse_id"])
+                                    + "/files",
+                                    data=json.dumps(params)).text)
+    log_records.append((logging.DEBUG, "%s", (json.dumps(upload_creds, indent=4),)))
 
-        for localfile in files:
-            # if a matching file is found locally, don't delete it.
-            if (remotefile["name"] == localfile["name"]):
-                deletion_required = False
-                break
+    # actually transfer
+    log_records.append((logging.INFO, "Starting transfer", ()))
 
-        if access_path == "/images":
-            for whitelistfile in whitelist:
-                # also keep auto generated images by thingiverse, which is 
-                # always "<NameOfExisting3dFile>.png", pulled from whitelist
-                if (remotefile["name"] == os.path.splitext(
-                                            whitelistfile["name"])[0] 
-                                            + ".png"):
-                    deletion_required = False
-                    break
+    params = upload_creds["fields"]
 
-        if deletion_required:
-            files_to_delete.append(remotefile)
+    # The storage endpoint is not part of the API and gets no API token
+    with MultipartFileStream(params, "file", file["path"], file["name"],
+                             progress(file["name"])) as body:
+        client.post(THINGIVERSE_UPLOAD_URL, data=body,
+                    headers={"Authorization": None,
+                             "Content-Type": body.content_type},
+                    allow_redirects=False)
 
+    # close transfer
+    log_records.append((logging.INFO, "Closing transfer", ()))
+    finalize_response = json.loads(
+                         client.post(
+                          upload_creds["fields"]["success_action_redirect"]).text)
 
-    # output upcoming file operations
-    logger.info("Files to be uploaded:")
-    for file in files_to_upload:
-        logger.info(file["name"])
+    return finalize_response, log_records
 
-    logger.info("Files to be deleted:")
-    for file in files_to_delete:
-        logger.info(file["name"])
 
-    ########## File deletions
+def thingiverse_set_image_order(thingdata, client, existing_images=None):
+    """Sets image order of recently uploaded pictures, based on filename.
 
-    for file in files_to_delete:
+    The images are listed from Thingiverse unless existing_images is given.
+    Only images whose rank differs from the listed one are patched.
+    """
 
-        logger.info("Starting deletion of %s", file["name"])
+    logger.info("Ranking images based on file names")
 
-        deletion_response = json.loads(delete("https://api.thingiverse.com/things/"
+    if existing_images is None:
+        existing_images = json.loads(client.get("/things/"
                                 + str(thingdata["thingiverse_id"])
-                                + access_path + "/"
-                                + str(file["id"]),
-                                headers=headers).text)
-
-        #logger.info(json.dumps(deletion_response, indent=4))
+                                + "/images").text)
 
-    ########## File uploads
-
-    for file in files_to_upload:
-        logger.info("Starting upload of %s", file["name"])
-
-        # open up transfer
-        logger.info("Opening transfer")
-        params = {"filename": file["name"]}
-        upload_creds = json.loads(
-                        post("https://api.thingiverse.com/things/"
-                                        + str(thingdata["thingiverse_id"])
-                                        + "/files",
-                                        data=json.dumps(params),
-                                        headers=headers).text)
-        logger.debug(json.dumps(upload_creds, indent=4))
+    thingiverse_log_image_ranks(existing_images)
 
-        # actually transfer
-        logger.info("Starting transfer")
+    thingiverse_rank_images(thingdata, client,
+                            thingiverse_rank_changes(existing_images),
+                            len(existing_images))
 
-        files = {'file': open(file["path"], 'rb')}
-        params = upload_creds["fields"]
 
-        post("https://www.thingiverse.com/upload_file_storage", files=files, data=params, allow_redirects=False)
-
-        # close transfer
-        logger.info("Closing transfer")
-        finalize_response = json.loads(
-                             requests.post(
-                              upload_creds["fields"]["success_action_redirect"],
-                              headers=headers).text)
-
-
-def thingiverse_set_image_order(imgfiles, thingdata, headers):
-    """Sets image order of recently uploaded pictures, based on filename"""
-
-    logger.info("Ranking images based on file names")
-
-    existing_images = json.loads(get("https://api.thingiverse.com/things/"
-                            + str(thingdata["thingiverse_id"])
-                            + "/images", headers=headers).text)
-
-    # Iterate through uploaded files
-    number_of_invalid_filenames = 0
-    for remote_image in existing_images:
-        # Assign rank to each file that has a valid name
-        if re.match("[0-9][0-9]-+", remote_image["name"]) is not None:
-            remote_image["rank"] = remote_image["name"][:2]
-            logger.info("Found valid filename: %s, Rank: %s",remote_image["name"], remote_image["rank"])
-        # If no valid name is found, assign rank starting from 100
+def thingiverse_log_image_ranks(images):
+    """Outputs the rank each image of a listing gets from its file name"""
+    for remote_image, rank in zip(images, thingiverse_image_ranks(images)):
+        if rank < 100:
+            logger.info("Found valid filename: %s, Rank: %s", remote_image["name"], rank)
         else:
-            remote_image["rank"] = 100 + number_of_invalid_filenames
-            number_of_invalid_filenames += 1
+            logger.info("Not a valid filename for ranking: %s, Rank: %s", remote_image["name"], rank)
+
+
+def thingiverse_rank_changes(images):
+    """Returns the images of a listing whose rank needs to change"""
+    changes = []
+    for image, rank in zip(images, thingiverse_image_ranks(images)):
+        try:
+            current_rank = int(image.get("rank"))
+        except (TypeError, ValueError):
+            current_rank = None
+
+        if current_rank != rank:
+            changes.append({"id":   image["id"],
+                            "name": image["name"],
+                            "from": current_rank,
+                            "to":   rank})
+    return changes
+
+
+def thingiverse_rank_images(thingdata, client, image_ranks, number_of_images=None):
+    """Patches the rank changes from thingiverse_rank_changes concurrently"""
+    if number_of_images is not None:
+        logger.info("Patching %d of %d image ranks, %d calls saved",
+                    len(image_ranks), number_of_images,
+                    number_of_images - len(image_ranks))
+
+    workers = max(1, min(THINGIVERSE_API_WORKERS, len(image_ranks)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+                    lambda image: thingiverse_rank_image(thingdata, client,
+                                                         image["id"], image["to"]),
+                    image_ranks)
+
+        for image, _ in zip(image_ranks, results):
+            logger.info("Ranked %s: %s -> %s", image["name"], image["from"], image["to"])
 
-            logger.info("Not a valid filename for ranking: %s, Rank: %s", remote_image["name"], remote_image["rank"])
+    logger.info("All images ranked")
 
-        # Actually patch image with new rank
-        params      = {"rank":remote_image["rank"]}
-        img_answer2 = patch("https://api.thingiverse.com/things/" +
-                                    str(thingdata["thingiverse_id"]) +
-                                    "/images/"+
-                                    str(remote_image["id"]),
-                                    headers=headers,
-                                    data=json.dumps(params))
 
-    logger.info("All images ranked")
+def thingiverse_rank_image(thingdata, client, image_id, rank):
+    """Sets the rank of a single image"""
+    params      = {"rank":rank}
+    img_answer2 = client.patch("/things/" +
+                                str(thingdata["thingiverse_id"]) +
+                                "/images/"+
+                                str(image_id),
+                                data=json.dumps(params))
+    client.journal_operation("rank", thing=thingdata["thingiverse_id"],
+                             id=image_id, rank=rank)
 
 
-def thingiverse_publish_project(thingdata, headers):
+def thingiverse_publish_project(thingdata, client):
     """Create publish request"""
     # POST /things/{$id}/publish
-    PublishAnswer = requests.post("https://api.thingiverse.com/things/"+
+    PublishAnswer = client.post("/things/"+
                                 str(thingdata["thingiverse_id"])+
-                                "/publish",
-                                headers=headers)
+                                "/publish")
+    client.journal_operation("publish", thing=thingdata["thingiverse_id"])
     
     logger.info("Thing published")
 
@@ -264,6 +1622,8 @@ def thingiverse_publish_project(thingdata, headers):
 def thingiverse_request_token():
     """Take app client ID and generate an API token with write acces"""
 
+    import webbrowser
+
     logger.info("Running in API token request mode")
 
     # Open up a webbrowser with the authorization URL
@@ -329,6 +1689,13 @@ def create_initial_folder_structure(project_path):
     "InitialCreation\n"
     "ThingURL.txt\n"
     "ThingID.txt\n"
+    "DeployedCommit.txt\n"
+    "DeployPlan.json\n"
+    "DeployReport.json\n"
+    "DeployPlan-directory.json\n"
+    "DeployReport-directory.json\n"
+    "DeployedCommit-directory.txt\n"
+    ".threedeploy-journal.jsonl\n"
     "ApiToken.txt\n"
     )
 
@@ -401,10 +1768,531 @@ def create_initial_folder_structure(project_path):
 ##########################################################################
 
 ########## General
-def deploy_project(project_path, api_token, destination):
-    """Deploy the project using an API token generated by --request-token"""
+class ProjectFile(NamedTuple):
+    """A deployable file found in a project folder"""
+    name:       str
+    path:       str
+    folder:     str
+    size:       int
+    mtime:      float
+    mtime_ns:   int
+    inode:      int
+
+
+def scan_project_files(project_path, paths=None):
+    """Finds the deployable files of a project in a single pass.
+
+    Walks each folder of PROJECT_FILE_TYPES including its subfolders, and
+    classifies files by lower case extension. The stat results of the
+    directory scan are reused. Returns the ProjectFiles of each folder,
+    sorted by path. Hidden folders are skipped. Symlinked folders are
+    followed, but every folder is only scanned once, so a link back up the
+    tree does not loop. Folders that can't be read are skipped with a
+    warning. If several files share a name, only the first one is kept,
+    since Thingiverse names are flat.
+
+    With paths, relative to the project folder and "/" separated as git
+    reports them, only those files are looked at instead of walking the
+    folders. Paths that no longer exist are left out.
+    """
+    projectfiles = {}
+    for folder, extensions in PROJECT_FILE_TYPES.items():
+        if paths is not None:
+            projectfiles[folder] = stat_project_paths(project_path, folder,
+                                                      extensions, paths)
+            continue
+
+        found = []
+        visited = set()
+        pending = [os.path.join(project_path, folder)]
+        while pending:
+            path = pending.pop()
+            try:
+                folder_stat = os.stat(path)
+                if (folder_stat.st_dev, folder_stat.st_ino) in visited:
+                    continue
+                visited.add((folder_stat.st_dev, folder_stat.st_ino))
+                entries = os.scandir(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning("Skipping folder %s: %s", path, e)
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir():
+                        pending.append(entry.path)
+                    elif (entry.is_file() and
+                          os.path.splitext(entry.name)[1].lower() in extensions):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        found.append(ProjectFile(entry.name, entry.path, folder,
+                                                 stat.st_size, stat.st_mtime,
+                                                 stat.st_mtime_ns, stat.st_ino))
+        found.sort(key=lambda file: file.path)
+        projectfiles[folder] = found
+
+    # Thingiverse file names are flat, so names must be unique per Thing
+    names = set()
+    for folder in PROJECT_FILE_TYPES:
+        unique = []
+        for file in projectfiles[folder]:
+            if file.name in names:
+                logger.warning("Skipping %s, a file named %s was already found",
+                               file.path, file.name)
+                continue
+            names.add(file.name)
+            unique.append(file)
+        projectfiles[folder] = unique
+
+    return projectfiles
+
+
+def stat_project_paths(project_path, folder, extensions, paths):
+    """Returns the ProjectFiles of one folder among paths, sorted by path"""
+    found = []
+    for relpath in paths:
+        parts = relpath.split("/")
+        if (len(parts) < 2 or parts[0] != folder
+                or any(part.startswith(".") for part in parts)
+                or os.path.splitext(parts[-1])[1].lower() not in extensions):
+            continue
+        path = os.path.join(project_path, *parts)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        found.append(ProjectFile(parts[-1], path, folder, stat.st_size,
+                                 stat.st_mtime, stat.st_mtime_ns, stat.st_ino))
+    found.sort(key=lambda file: file.path)
+    return found
+
+
+########## Git
+def is_project_path(relpath):
+    """Tells if a path relative to the project folder is deployed"""
+    if relpath in ("README.md", "thingdata.json"):
+        return True
+    parts = relpath.split("/")
+    return (len(parts) > 1 and parts[0] in PROJECT_FILE_TYPES
+            and not any(part.startswith(".") for part in parts)
+            and os.path.splitext(parts[-1])[1].lower()
+                in PROJECT_FILE_TYPES[parts[0]])
+
+
+def git_output(project_path, *args):
+    """Runs git in the project folder, returns its output or None if it fails"""
+    import subprocess
+
+    try:
+        result = subprocess.run(["git", "-C", project_path] + list(args),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        logger.debug("git %s failed: %s", args[0], result.stderr.strip())
+        return None
+    return result.stdout
+
+
+def git_changes_since_deployed(project_path, commit_file_name):
+    """Returns the checked out commit and the paths changed since the last
+    one deployed, as recorded in commit_file_name.
+
+    The paths are relative to the project folder, limited to deployed files
+    and include uncommitted and untracked changes. They are None if the
+    whole project has to be deployed: if no commit was recorded yet, or git
+    does not know it, e.g. in a shallow clone. The commit is None outside
+    of a git checkout.
+    """
+    head = git_output(project_path, "rev-parse", "--verify", "HEAD")
+    if head is None:
+        logger.warning("%s is not a git checkout, deploying everything",
+                       project_path)
+        return None, None
+    head = head.strip()
+
+    try:
+        with open(os.path.join(project_path, commit_file_name),
+                  "r", encoding="utf-8") as f:
+            deployed = f.read().strip()
+    except FileNotFoundError:
+        logger.info("No %s found, deploying everything", commit_file_name)
+        return head, None
+
+    changed = git_output(project_path, "diff", "--name-only", "--no-renames",
+                         "--relative", "-z", deployed, "--", *GIT_PROJECT_PATHS)
+    untracked = git_output(project_path, "ls-files", "--others",
+                           "--exclude-standard", "-z", "--", *GIT_PROJECT_PATHS)
+    if changed is None or untracked is None:
+        logger.warning("git can not compare with deployed commit %s, "
+                       "deploying everything", deployed)
+        return head, None
+
+    paths = set(relpath for relpath in changed.split("\0") + untracked.split("\0")
+                if relpath and is_project_path(relpath))
+    logger.info("%d deployed files changed since commit %s", len(paths), deployed)
+    for relpath in sorted(paths):
+        logger.info(relpath)
+    return head, paths
+
+
+def write_deployed_commit(project_path, commit_file_name, commit):
+    with open(os.path.join(project_path, commit_file_name),
+              "w", encoding="utf-8") as f:
+        f.write(commit + "\n")
+
+
+def changed_file_names(changes):
+    """Returns the file names of changed paths, as Thingiverse names files"""
+    return set(relpath.split("/")[-1] for relpath in changes)
 
-    logger.info("Deploying project:")
+
+##########################################################################
+##                     Pre-upload optimization                          ##
+##########################################################################
+def optimize_project_files(projectfiles):
+    """Replaces project files by smaller equivalents before they are deployed.
+
+    With OPTIMIZE_MODELS, ASCII STL files are converted to binary STL. With
+    BUNDLE_SMALL_FILES, the small files of BUNDLE_FOLDERS are packed into
+    one BUNDLE_FILE_NAME zip. With OPTIMIZE_IMAGES, images are downscaled
+    and re-encoded. Results are stored in OPTIMIZE_CACHE_DIR under the
+    content hash of their sources, so unchanged files are never processed
+    twice. Returns projectfiles with the replaced entries, whose path points
+    to the cached result.
+    """
+    projectfiles = dict(projectfiles)
+    os.makedirs(OPTIMIZE_CACHE_DIR, exist_ok=True)
+
+    if OPTIMIZE_MODELS:
+        projectfiles["3d"] = optimize_stl_files(projectfiles["3d"])
+
+    if OPTIMIZE_IMAGES:
+        projectfiles["img"] = optimize_image_files(projectfiles["img"])
+
+    if BUNDLE_SMALL_FILES:
+        small = [file for folder in BUNDLE_FOLDERS for file in projectfiles[folder]
+                 if file.size <= BUNDLE_MAX_FILE_SIZE]
+        # A bundle of a single file is only harder to open
+        if len(small) > 1:
+            bundled = set(small)
+            for folder in BUNDLE_FOLDERS:
+                projectfiles[folder] = [file for file in projectfiles[folder]
+                                        if file not in bundled]
+            projectfiles[BUNDLE_FOLDERS[0]].append(bundle_project_files(small))
+
+    return projectfiles
+
+
+def optimize_stl_files(files):
+    """Returns files with ASCII STLs replaced by cached binary conversions"""
+    from importlib.util import find_spec
+
+    # Only the conversion imports NumPy
+    if find_spec("numpy") is None:
+        logger.warning("NumPy is required for converting STL files, "
+                       "deploying them unchanged")
+        return files
+
+    optimized = []
+    for file in files:
+        if (not file.name.lower().endswith(".stl")
+                or not stl_is_ascii(file.path, file.size)):
+            optimized.append(file)
+            continue
+
+        sha256 = file_fingerprint(file.path, file)
+        cachepath = os.path.join(OPTIMIZE_CACHE_DIR, sha256 + ".binary.stl")
+        if not os.path.isfile(cachepath):
+            try:
+                convert_ascii_stl(file.path, cachepath)
+            except ValueError as e:
+                logger.warning("Cannot convert %s, deploying it unchanged: %s",
+                               file.name, e)
+                optimized.append(file)
+                continue
+
+        # Binary STL has a fixed size per facet, tiny files may grow
+        stat = os.stat(cachepath)
+        if stat.st_size >= file.size:
+            optimized.append(file)
+            continue
+
+        logger.info("Converted %s to binary STL: %d -> %d bytes",
+                    file.name, file.size, stat.st_size)
+        optimized.append(file._replace(path=cachepath, size=stat.st_size,
+                                       inode=stat.st_ino))
+    return optimized
+
+
+def stl_is_ascii(path, size):
+    """Returns True for ASCII STL files.
+
+    Binary STLs may start with "solid" as well, so files whose size matches
+    the triangle count of a binary header are taken as binary.
+    """
+    with open(path, "rb") as f:
+        header = f.read(84)
+    if not header.lstrip().startswith(b"solid"):
+        return False
+    if len(header) == 84:
+        triangles = int.from_bytes(header[80:84], "little")
+        if 84 + 50 * triangles == size:
+            return False
+    return True
+
+
+def convert_ascii_stl(source, destination):
+    """Writes an ASCII STL file as binary STL.
+
+    The file is read in blocks of STL_PARSE_CHUNK_SIZE bytes, cut after
+    their last complete facet, so memory use does not grow with the file.
+    Each block is tokenized once and its coordinates are parsed as one NumPy
+    array, following the "normal" and "vertex" keywords. The facet count is
+    filled into the header at the end.
+    """
+    import numpy
+    import tempfile
+
+    def facets(data):
+        words = numpy.array(data.split())
+        normals  = numpy.flatnonzero(words == b"normal")
+        vertices = numpy.flatnonzero(words == b"vertex")
+        if len(vertices) != 3 * len(normals):
+            raise ValueError("%d facets with %d vertices" % (len(normals),
+                                                             len(vertices)))
+
+        def coordinates(keywords):
+            return words[keywords[:, None] + numpy.arange(1, 4)].astype(numpy.float32)
+
+        block = numpy.zeros(len(normals), dtype=[("normal",     "<f4", (3,)),
+                                                 ("vertices",   "<f4", (3, 3)),
+                                                 ("attributes", "<u2")])
+        if len(normals):
+            block["normal"]   = coordinates(normals)
+            block["vertices"] = coordinates(vertices).reshape(-1, 3, 3)
+        return block
+
+    # Concurrent runs may convert the same file into the shared cache
+    f = tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(destination) or ".",
+                                    suffix=".tmp", delete=False)
+    try:
+        with f, open(source, "rb") as stl:
+            f.write(BINARY_STL_HEADER.ljust(80, b" "))
+            f.write(bytes(4))
+            count = 0
+            pending = b""
+            while True:
+                chunk = stl.read(STL_PARSE_CHUNK_SIZE)
+                data = pending + chunk
+                if chunk:
+                    end = data.rfind(b"endfacet")
+                    if end < 0:
+                        pending = data
+                        continue
+                    end += len(b"endfacet")
+                    data, pending = data[:end], data[end:]
+                block = facets(data)
+                f.write(block.tobytes())
+                count += len(block)
+                if not chunk:
+                    break
+            f.seek(80)
+            f.write(count.to_bytes(4, "little"))
+        os.replace(f.name, destination)
+    except BaseException:
+        try:
+            os.remove(f.name)
+        except OSError:
+            pass
+        raise
+
+
+def optimize_image_files(files):
+    """Returns files with images replaced by cached, downscaled versions.
+
+    Images are processed by IMAGE_WORKERS processes. BMP files become PNG
+    and are renamed accordingly, unless that name is already taken.
+    """
+    from importlib.util import find_spec
+
+    # Only the worker processes import Pillow
+    if find_spec("PIL") is None:
+        logger.warning("Pillow is required for optimizing images, "
+                       "deploying them unchanged")
+        return files
+
+    names = set(file.name for file in files)
+    jobs = []
+    for file in files:
+        base, extension = os.path.splitext(file.name)
+        extension = extension.lower()
+        name = file.name
+        if extension == ".bmp" and base + ".png" not in names:
+            name = base + ".png"
+            extension = ".png"
+        elif extension == ".bmp":
+            extension = None
+        elif extension == ".jpeg":
+            extension = ".jpg"
+
+        cachepath = None
+        if extension is not None:
+            cachepath = os.path.join(OPTIMIZE_CACHE_DIR, "%s-%d-%d%s" % (
+                                     file_fingerprint(file.path, file),
+                                     IMAGE_MAX_SIZE, IMAGE_JPEG_QUALITY,
+                                     extension))
+        jobs.append((file, name, cachepath))
+
+    pending = [(file.path, cachepath) for file, name, cachepath in jobs
+               if cachepath is not None and not os.path.isfile(cachepath)]
+    if pending:
+        logger.info("Processing %d images", len(pending))
+        from concurrent.futures import ProcessPoolExecutor
+
+        workers = max(1, min(IMAGE_WORKERS, len(pending)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(preprocess_image, source, cachepath,
+                                       IMAGE_MAX_SIZE, IMAGE_JPEG_QUALITY)
+                       for source, cachepath in pending]
+            for (source, _), future in zip(pending, futures):
+                error = future.result()
+                if error is not None:
+                    logger.warning("Cannot process %s, deploying it unchanged: %s",
+                                   source, error)
+
+    optimized = []
+    for file, name, cachepath in jobs:
+        if cachepath is None or not os.path.isfile(cachepath):
+            optimized.append(file)
+            continue
+
+        # Re-encoding small images that need no resizing may not pay off,
+        # but BMPs are always converted to keep their new name
+        stat = os.stat(cachepath)
+        if stat.st_size >= file.size and name == file.name:
+            optimized.append(file)
+            continue
+
+        logger.info("Optimized %s: %d -> %d bytes", name, file.size, stat.st_size)
+        optimized.append(file._replace(name=name, path=cachepath,
+                                       size=stat.st_size, inode=stat.st_ino))
+    return optimized
+
+
+def preprocess_image(source, destination, max_size, jpeg_quality):
+    """Downscales an image to max_size and saves it without metadata.
+
+    The image format follows the extension of destination. Runs in a worker
+    process, returns an error message instead of raising.
+    """
+    import tempfile
+    from PIL import Image, ImageOps
+
+    # Concurrent runs may write the same image into the shared cache
+    temp = tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(destination) or ".",
+                                       suffix=".tmp", delete=False)
+    try:
+        with temp, Image.open(source) as image:
+            # Rotation is only stored in the metadata that gets dropped
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+            if destination.endswith(".jpg"):
+                image.convert("RGB").save(temp, "JPEG", quality=jpeg_quality,
+                                          optimize=True, progressive=True)
+            else:
+                image.save(temp, "PNG", optimize=True)
+        os.replace(temp.name, destination)
+    except (OSError, ValueError) as e:
+        return str(e)
+    finally:
+        # Only left over if saving failed
+        try:
+            os.remove(temp.name)
+        except OSError:
+            pass
+    return None
+
+
+def bundle_project_files(files):
+    """Returns a ProjectFile for a cached zip of files.
+
+    The zip is reproducible: members are stored under their project path in
+    a fixed order and with a fixed timestamp, so its hash only changes with
+    the bundled contents.
+    """
+    members = sorted((os.path.join(file.folder, file.name), file) for file in files)
+
+    digest = hashlib.sha256()
+    for arcname, file in members:
+        sha256 = file_fingerprint(file.path, file)
+        digest.update(("%s\0%s\0" % (arcname, sha256)).encode("utf-8"))
+    cachepath = os.path.join(OPTIMIZE_CACHE_DIR, digest.hexdigest() + ".zip")
+
+    if not os.path.isfile(cachepath):
+        import tempfile
+        import zipfile
+
+        # Concurrent runs may build the same bundle into the shared cache
+        temp = tempfile.NamedTemporaryFile("wb", dir=OPTIMIZE_CACHE_DIR,
+                                           suffix=".tmp", delete=False)
+        try:
+            with temp, zipfile.ZipFile(temp, "w", zipfile.ZIP_DEFLATED) as bundle:
+                for arcname, file in members:
+                    info = zipfile.ZipInfo(arcname, date_time=(1980, 1, 1, 0, 0, 0))
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    with open(file.path, "rb") as f:
+                        bundle.writestr(info, f.read())
+            os.replace(temp.name, cachepath)
+        except BaseException:
+            try:
+                os.remove(temp.name)
+            except OSError:
+                pass
+            raise
+
+    stat = os.stat(cachepath)
+    logger.info("Bundled %d small files into %s: %d -> %d bytes",
+                len(members), BUNDLE_FILE_NAME,
+                sum(file.size for file in files), stat.st_size)
+    newest = max(files, key=lambda file: file.mtime_ns)
+    return ProjectFile(BUNDLE_FILE_NAME, cachepath, BUNDLE_FOLDERS[0],
+                       stat.st_size, newest.mtime, newest.mtime_ns, stat.st_ino)
+
+
+class Project(NamedTuple):
+    """A scanned project, ready to be deployed to any destination"""
+    path:           str
+    thingdata:      dict
+    description:    str
+    modelfiles:     list
+    imgfiles:       list
+    # Names of the files changed since the deployed commit, None if every
+    # file is deployed
+    scope:          set = None
+
+
+def scan_project(project_path, report, changes=None):
+    """Reads thingdata.json and README.md and finds the deployable files.
+
+    Runs the optimization stage if enabled. Scanning and optimizing are
+    recorded as phases of report. With changes, paths from
+    git_changes_since_deployed, only those files are scanned and deployed.
+    """
+    report.phase("scan")
+
+    if changes is not None and (OPTIMIZE_MODELS or BUNDLE_SMALL_FILES
+                                or OPTIMIZE_IMAGES):
+        # Converted files and bundles don't map to single changed paths
+        logger.info("Optimized files are deployed as a whole, scanning everything")
+        changes = None
 
     ##########################################################################
     ##                          File parsing                                ##
@@ -430,64 +2318,57 @@ def deploy_project(project_path, api_token, destination):
         logger.info("----------------------------------------")
 
     ########## model / source files
-    threedpath      = project_path + "/3d"
-    sourcepath      = project_path + "/source"
-    gcodepath       = project_path + "/gcode"
-    modelfiles      = []
-    for file in os.listdir(threedpath):
-        if (file.endswith(".stl")  or
-            file.endswith(".obj")  or
-            file.endswith(".stp")  or
-            file.endswith(".STEP") or
-            file.endswith(".3mf")):
-            modelfiles.append({"name":file, 
-                                "path":os.path.join(threedpath, file),
-                                "date":os.path.getmtime(
-                                    os.path.join(threedpath, file))})
-
-    for file in os.listdir(sourcepath):
-        if (file.endswith(".FCStd")  or
-            file.endswith(".scad")  or
-            file.endswith(".f3d")):
-            modelfiles.append({"name":file, 
-                                "path":os.path.join(sourcepath, file),
-                                "date":os.path.getmtime(
-                                    os.path.join(sourcepath, file))})
-
-    for file in os.listdir(gcodepath):
-        if file.endswith(".gcode"):
-            modelfiles.append({"name":file, 
-                                "path":os.path.join(gcodepath, file),
-                                "date":os.path.getmtime(
-                                    os.path.join(gcodepath, file))})
+    projectfiles    = scan_project_files(project_path, changes)
+
+    # Contents of model files are compared, and the sources of optimized
+    # files hashed, so fingerprint all of them on the thread pool up front
+    report.phase("fingerprint")
+    hash_project_files(projectfiles["3d"] + projectfiles["source"]
+                       + projectfiles["gcode"]
+                       + (projectfiles["img"] if OPTIMIZE_IMAGES else []))
+    if OPTIMIZE_MODELS or BUNDLE_SMALL_FILES or OPTIMIZE_IMAGES:
+        report.phase("optimize")
+        projectfiles = optimize_project_files(projectfiles)
+    modelfiles      = (projectfiles["3d"] + projectfiles["source"]
+                       + projectfiles["gcode"])
 
     logger.info("Found model files: ")
     for file in modelfiles:
-        logger.info(file["name"])
+        logger.info(file.name)
     logger.info("----------------------------------------")
 
     ########## Images
-    imgpath         = project_path + "/img"
-    imgfiles        = []
-    for file in os.listdir(imgpath):
-        if (file.endswith(".png") or
-            file.endswith(".jpg") or
-            file.endswith(".bmp")):
-            imgfiles.append({"name":file, 
-                             "path":os.path.join(imgpath, file),
-                             "thingiverse_id":0})
+    imgfiles        = projectfiles["img"]
 
     logger.info("Found image files: ")
     for file in imgfiles:
-        logger.info(file["name"])
+        logger.info(file.name)
     logger.info("----------------------------------------")
 
-    ##########################################################################
-    ##                    Site specific deployment                          ##
-    ##########################################################################
+    scope = None
+    if changes is not None:
+        scope = changed_file_names(changes)
+
+    return Project(project_path, thingdata, description, modelfiles, imgfiles,
+                   scope)
+
+
+def deploy_project(project_path, api_token, destination, plan_only=False,
+                   client=None):
+    """Deploy the project using an API token generated by --request-token.
+
+    For the 'directory' destination, api_token is the folder to deploy to.
+    With GIT_INCREMENTAL, only files changed since the deployed commit are
+    deployed, and nothing (returning None) if there are none. With
+    plan_only, the changes are only computed and written to
+    PLAN_FILE_NAME, nothing is changed on the destination. An already open
+    client for the destination can be passed in to share its connections.
+    """
     if destination == 'thingiverse':
-        logger.info("Deploying to Thingiverse!")
-        deploy_thingiverse(api_token, thingdata, project_path, modelfiles, imgfiles)
+        backend = ThingiverseBackend(api_token, client)
+
+    elif destination == 'directory':
+        backend = DirectoryBackend(api_token)
 
     elif destination == 'myminifactory':
         logger.info('MyMiniFactory deployment not implemented yet, sorry')
@@ -501,157 +2382,854 @@ def deploy_project(project_path, api_token, destination):
         logger.info('Thangs deployment not implemented yet, sorry')
         sys.exit(os.EX_USAGE)
 
+    else:
+        logger.error("Unknown destination %s, exiting", destination)
+        sys.exit(os.EX_USAGE)
+
+    logger.info("Deploying project:")
+
+    commit = changes = None
+    if GIT_INCREMENTAL:
+        commit, changes = git_changes_since_deployed(project_path,
+                                                     backend.commit_file_name)
+        if changes is not None and not changes:
+            logger.info("Nothing changed since the deployed commit, done")
+            return None
+
+    report = DeployReport()
+    project = scan_project(project_path, report, changes)
+
+    ##########################################################################
+    ##                    Site specific deployment                          ##
+    ##########################################################################
+    try:
+        with backend:
+            plan = backend.deploy(project, report, plan_only)
+    finally:
+        save_fingerprint_cache()
+
+    if commit is not None and not plan_only:
+        write_deployed_commit(project_path, backend.commit_file_name, commit)
+    return plan
+
+
+def deploy_project_destinations(project_path, backends, plan_only=False,
+                                changes=None):
+    """Scans a project once and deploys it to all backends at the same time.
+
+    Every backend deploys in its own thread over its own connections and
+    rate limits, so the deployment takes as long as the slowest destination.
+    Backends that copy the project folder start once the others finished
+    updating it. A failing destination does not stop the others. Returns a
+    summary entry per backend, in the order of backends.
+
+    With GIT_INCREMENTAL, every backend deploys the changes since its own
+    deployed commit, and backends without changes are skipped. changes,
+    paths relative to the project folder as reported by a watcher, limit
+    every backend to those instead.
+    """
+    logger.info("Deploying project to %s:",
+                ", ".join(backend.name for backend in backends))
+
+    # Each destination has its own deployed commit, the scan covers the
+    # changes of all of them
+    deltas = dict((backend, (None, changes)) for backend in backends)
+    if GIT_INCREMENTAL and changes is None:
+        for backend in backends:
+            deltas[backend] = git_changes_since_deployed(project_path,
+                                                         backend.commit_file_name)
+    changes = None
+    if all(delta[1] is not None for delta in deltas.values()):
+        changes = set().union(*(delta[1] for delta in deltas.values()))
+
+    project = None
+    report = DeployReport()
+    if changes is None or changes:
+        project = scan_project(project_path, report, changes)
+    report.finish()
+
+    # Backends copying the project folder wait for the others, which may
+    # still update files in it such as thingdata.json
+    writers = [backend for backend in backends if not backend.copies_project]
+    writers_done = threading.Event()
+    writers_lock = threading.Lock()
+    if not writers:
+        writers_done.set()
+
+    def deploy_one(backend, outcome):
+        if backend.copies_project:
+            writers_done.wait()
+        try:
+            deploy_backend(backend)
+        finally:
+            if not backend.copies_project:
+                with writers_lock:
+                    writers.remove(backend)
+                    if not writers:
+                        writers_done.set()
+
+    def deploy_backend(backend):
+        commit, backend_changes = deltas[backend]
+        if backend_changes is not None and not backend_changes:
+            logger.info("Nothing changed since the commit deployed to %s",
+                        backend.name)
+            return
+
+        # Destinations may record IDs in their thingdata, don't share it
+        backend_project = project._replace(
+                           thingdata=copy.deepcopy(project.thingdata))
+        if project.scope is not None:
+            backend_project = backend_project._replace(
+                               scope=changed_file_names(backend_changes))
+        with backend:
+            backend.deploy(backend_project, report.branch(), plan_only)
+        if commit is not None and not plan_only:
+            write_deployed_commit(project_path, backend.commit_file_name, commit)
+
+    jobs = [({"destination": backend.name,
+              "status":      "ok",
+              "seconds":     0.0,
+              "error":       None}, functools.partial(deploy_one, backend))
+            for backend in backends]
+    try:
+        return run_deployments("Destination", jobs, len(backends),
+                               [("Seconds", "seconds", "9.1f")],
+                               ("Destination", "destination"))
+    finally:
+        save_fingerprint_cache()
+
+
+def run_deployments(title, jobs, workers, columns, name):
+    """Runs deployments on up to workers threads, then logs a summary table.
+
+    jobs are (outcome, deploy) pairs, deploy(outcome) is called for each.
+    Outcomes are dicts with "status", "seconds" and "error" to be filled
+    in, deploy may add more. A deployment that fails is logged and marked
+    as failed, it does not stop the others. The table lists the status,
+    the (heading, key, format) columns and the (heading, key) name of each
+    outcome. Returns the outcomes, in the order of jobs.
+    """
+    def run(job):
+        outcome, deploy = job
+        start = time.monotonic()
+        try:
+            deploy(outcome)
+        except SystemExit as e:
+            if e.code not in (None, os.EX_OK):
+                outcome["status"] = "failed"
+                outcome["error"]  = "exit code %s" % e.code
+        except Exception as e:
+            logger.exception("Deploying %s failed", outcome[name[1]])
+            outcome["status"] = "failed"
+            outcome["error"]  = str(e)
+        outcome["seconds"] = round(time.monotonic() - start, 3)
+        return outcome
+
+    workers = max(1, min(workers, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        summary = list(executor.map(run, jobs))
+
+    log_deployment_summary(title, summary, columns, name)
+    return summary
+
+
+def log_deployment_summary(title, summary, columns, name):
+    """Outputs one line per outcome of run_deployments"""
+    widths = [re.match(r"\d*", format).group() for _, _, format in columns]
+    heading_line = "%-8s " + "".join("%" + width + "s " for width in widths) + " %s"
+    outcome_line = "%-8s " + "".join("%" + format + " " for _, _, format in columns) + " %s"
+
+    logger.info("----------------------------------------")
+    logger.info("%s summary:", title)
+    logger.info(heading_line, "Status", *[heading for heading, _, _ in columns],
+                name[0])
+    for outcome in summary:
+        logger.info(outcome_line, outcome["status"],
+                    *[outcome[key] for _, key, _ in columns], outcome[name[1]])
+        if outcome["error"]:
+            logger.info("         %s", outcome["error"])
+    failed = sum(1 for outcome in summary if outcome["status"] != "ok")
+    logger.info("%d of %d deployed", len(summary) - failed, len(summary))
+    logger.info("----------------------------------------")
+
+
+########## Destinations
+class DeployBackend:
+    """A destination projects are deployed to.
+
+    Backends are context managers: connections are opened on entering and
+    closed on exiting the outermost with block. deploy() brings the
+    destination in line with a scanned Project, or with plan_only only
+    reports what it would change, and returns the plan.
+    """
+
+    name = None
+
+    # Records the last deployed git commit in the project folder
+    commit_file_name = None
+
+    # Copies the files of the project folder as they are on disk, so it
+    # runs after backends that update them while deploying
+    copies_project = False
+
+    # Nested with blocks share one opening, so watch mode can keep a
+    # backend open across deployments
+    _entered = 0
+
+    def __enter__(self):
+        if self._entered == 0:
+            self.open()
+        self._entered += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._entered -= 1
+        if self._entered == 0:
+            self.close()
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def deploy(self, project: Project, report: DeployReport,
+               plan_only: bool = False):
+        raise NotImplementedError
+
+
+class ThingiverseBackend(DeployBackend):
+    """Deploys to Thingiverse over a pooled ThingiverseClient.
+
+    The client, with its own connection pool and rate limiter, is opened
+    with the backend unless an already open one is passed in.
+    """
+
+    name = "thingiverse"
+    commit_file_name = DEPLOYED_COMMIT_FILE_NAME
+
+    def __init__(self, api_token: str, client: ThingiverseClient = None) -> None:
+        self.api_token = api_token
+        self.client = client
+        self._owns_client = client is None
+
+    def open(self) -> None:
+        if self.client is None:
+            self.client = ThingiverseClient(self.api_token)
+
+    def close(self) -> None:
+        if self._owns_client and self.client is not None:
+            log_client_stats(self.client)
+            self.client.close()
+            self.client = None
+
+    def deploy(self, project: Project, report: DeployReport,
+               plan_only: bool = False):
+        logger.info("Deploying to Thingiverse!")
+        self.client.report = report
+        return deploy_thingiverse_with_client(self.client, project.thingdata,
+                                              project.path, project.modelfiles,
+                                              project.imgfiles, plan_only,
+                                              project.scope)
+
+
+class DirectoryBackend(DeployBackend):
+    """Mirrors projects into a local folder, e.g. a network share.
+
+    Each project becomes a subfolder named like the project folder, holding
+    thingdata.json, README.md and the deployable files below their project
+    folder (3d, source, gcode, img). Files are copied with their
+    modification time, and only if size or modification time differ from
+    the copy already there. Files no longer in the project are removed,
+    when deploying changes since a commit only if they were deleted since.
+    Needs no network, so it also stands in for a site when testing.
+    """
+
+    name = "directory"
+    commit_file_name = DIRECTORY_DEPLOYED_COMMIT_FILE_NAME
+    copies_project = True
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def target_path(self, project: Project) -> str:
+        return os.path.join(self.path,
+                            os.path.basename(os.path.normpath(project.path)))
+
+    def plan(self, project: Project):
+        """Compares the project to its copy, returns the plan"""
+        target = self.target_path(project)
+        wanted = {"thingdata.json": os.path.join(project.path, "thingdata.json"),
+                  "README.md":      os.path.join(project.path, "README.md")}
+        for file in project.modelfiles + project.imgfiles:
+            if project.scope is None or file.name in project.scope:
+                wanted[os.path.join(file.folder, file.name)] = file.path
+
+        existing = {}
+        for root, _, names in os.walk(target):
+            for name in names:
+                path = os.path.join(root, name)
+                relpath = os.path.relpath(path, target)
+                # Only changed files are compared when deploying a delta
+                if (project.scope is not None and relpath not in wanted
+                        and name not in project.scope):
+                    continue
+                existing[relpath] = os.stat(path)
+
+        copies = []
+        for relpath, source in sorted(wanted.items()):
+            stat = os.stat(source)
+            present = existing.get(relpath)
+            if (present is None or present.st_size != stat.st_size
+                    or present.st_mtime_ns != stat.st_mtime_ns):
+                copies.append({"name": relpath, "source": source,
+                               "size": stat.st_size})
+
+        return {"destination": self.name,
+                "path":        target,
+                "copy":        copies,
+                "delete":      sorted(set(existing) - set(wanted))}
+
+    def deploy(self, project: Project, report: DeployReport,
+               plan_only: bool = False):
+        logger.info("Deploying to %s!", self.path)
+        try:
+            report.phase("plan")
+            plan = self.plan(project)
+            for entry in plan["copy"]:
+                logger.info("[%s] Copy %s", self.name, entry["name"])
+            for relpath in plan["delete"]:
+                logger.info("[%s] Delete %s", self.name, relpath)
+
+            if plan_only:
+                with open(os.path.join(project.path, DIRECTORY_PLAN_FILE_NAME),
+                          "w", encoding="utf-8") as f:
+                    f.write(json.dumps(plan, indent=4))
+                logger.info("Deploy plan written to %s", DIRECTORY_PLAN_FILE_NAME)
+                return plan
+
+            report.phase("transfer")
+            for entry in plan["copy"]:
+                destination = os.path.join(plan["path"], entry["name"])
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                # Replace atomically, a reader never sees half a file
+                copy_path = destination + ".tmp"
+                copy2(entry["source"], copy_path)
+                os.replace(copy_path, destination)
+            for relpath in plan["delete"]:
+                os.remove(os.path.join(plan["path"], relpath))
+            logger.info("[%s] %d files copied, %d deleted", self.name,
+                        len(plan["copy"]), len(plan["delete"]))
+            return plan
+        finally:
+            report.finish()
+            report.write(os.path.join(project.path, DIRECTORY_REPORT_FILE_NAME))
+            if REPORT_SUMMARY:
+                report.log_summary()
+
+
+def find_projects(patterns):
+    """Expands paths and glob patterns to project folders.
+
+    A folder counts as a project if it contains thingdata.json. Folders that
+    don't are searched one level down, so a parent folder of many projects
+    can be given. Returns the sorted, unique project paths.
+    """
+    projects = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern) or [pattern]:
+            if not os.path.isdir(path):
+                continue
+            if os.path.isfile(os.path.join(path, "thingdata.json")):
+                projects.add(os.path.normpath(path))
+                continue
+            for entry in os.scandir(path):
+                if (entry.is_dir() and
+                        os.path.isfile(os.path.join(entry.path, "thingdata.json"))):
+                    projects.add(os.path.normpath(entry.path))
+    return sorted(projects)
+
+
+def deploy_batch(project_paths, api_token, destination, plan_only=False):
+    """Deploys many projects concurrently over one shared client.
+
+    At most BATCH_WORKERS projects are deployed at the same time. All of them
+    share one connection pool and rate limiter. Returns a summary entry per
+    project, in the order of project_paths.
+    """
+    if destination != 'thingiverse':
+        logger.info('Batch deployment is only implemented for Thingiverse, sorry')
+        sys.exit(os.EX_USAGE)
+
+    logger.info("Deploying %d projects, %d at a time",
+                len(project_paths), BATCH_WORKERS)
+
+    pool_size = max(THINGIVERSE_POOL_SIZE,
+                    BATCH_WORKERS * THINGIVERSE_UPLOAD_WORKERS)
+
+    def deploy_one(outcome):
+        client = shared_client.fork()
+        try:
+            deploy_project(outcome["path"], api_token, destination, plan_only,
+                           client)
+        finally:
+            outcome["requests"] = client.stats["requests"]
+            outcome["retries"]  = client.stats["retries"]
+            try:
+                with open(os.path.join(outcome["path"], "thingdata.json"),
+                          "r", encoding="utf-8") as f:
+                    outcome["thingiverse_id"] = json.load(f).get("thingiverse_id", "")
+            except (OSError, ValueError):
+                pass
+
+    jobs = [({"path":           project_path,
+              "status":         "ok",
+              "thingiverse_id": "",
+              "seconds":        0.0,
+              "requests":       0,
+              "retries":        0,
+              "error":          None}, deploy_one)
+            for project_path in project_paths]
+    with ThingiverseClient(api_token, pool_size=pool_size) as shared_client:
+        return run_deployments("Batch", jobs, BATCH_WORKERS,
+                               [("Thing ID", "thingiverse_id", "10s"),
+                                ("Seconds",  "seconds",        "9.1f"),
+                                ("Requests", "requests",       "8d")],
+                               ("Project", "path"))
+
+
 ########## Thingiverse
-def deploy_thingiverse(api_token, thingdata, project_path, modelfiles, imgfiles):
+def log_client_stats(client):
+    """Outputs the request counters of a client"""
+    logger.info("Thingiverse requests: %d, retries: %d, "
+                "throttle waits: %d (%.1f seconds)",
+                client.stats["requests"], client.stats["retries"],
+                client.stats["throttle_waits"], client.stats["throttle_seconds"])
+    if client.cache is not None:
+        logger.info("Response cache: %d revalidated (%d bytes not transferred), "
+                    "%d fetched", client.cache.stats["hits"],
+                    client.cache.stats["bytes_saved"], client.cache.stats["misses"])
+
+
+def deploy_thingiverse_with_client(client, thingdata, project_path, modelfiles,
+                                   imgfiles, plan_only=False, scope=None):
     ##########################################################################
     ##                     Thingiverse deployment                           ##
     ##########################################################################
+    if client.report is None:
+        client.report = DeployReport()
+    report = client.report
+
+    try:
+        report.phase("plan")
+        state = thingiverse_resume_deploy(project_path, thingdata, plan_only)
+
+        if not plan_only:
+            client.journal = DeployJournal(os.path.join(project_path,
+                                                        JOURNAL_FILE_NAME))
+
+        if THINGIVERSE_ASYNCIO:
+            import asyncio
+
+            plan = asyncio.run(thingiverse_deploy_async(
+                                client, thingdata, project_path, modelfiles,
+                                imgfiles, state, plan_only, scope))
+        else:
+            plan, thing = thingiverse_plan_deploy(client, thingdata, modelfiles,
+                                                  imgfiles, state, scope)
+            thingiverse_log_plan(plan)
+
+            if plan_only:
+                thingiverse_write_plan(plan, project_path)
+            else:
+                thingiverse_execute_plan(client, plan, thing, thingdata,
+                                         project_path, state)
+
+        # Everything is deployed, nothing left to resume
+        if client.journal is not None:
+            client.journal.clear()
+        return plan
+    finally:
+        if client.journal is not None:
+            client.journal.close()
+            client.journal = None
+        report.finish()
+        report.write(project_path + "/" + REPORT_FILE_NAME)
+        if REPORT_SUMMARY:
+            report.log_summary()
+
+
+def thingiverse_resume_deploy(project_path, thingdata, plan_only=False):
+    """Loads the deploy state, including what an interrupted run completed.
+
+    Operations journaled by a deployment that did not finish are applied to
+    the state, so that the plan only contains what is left to do.
+    """
+    entries = load_deploy_journal(project_path)
+    if not entries:
+        return load_deploy_state(project_path, thingdata["thingiverse_id"])
+
+    logger.info("Resuming interrupted deployment, %d operations already done",
+                len(entries))
+
+    # The Thing may have been created without thingdata.json being updated
+    created = [entry for entry in entries if entry["op"] == "create"]
+    if thingdata["thingiverse_id"] == "" and created:
+        thingdata["thingiverse_id"] = created[-1]["thing"]
+        logger.info("Continuing with created thing ID %s", thingdata["thingiverse_id"])
+        if not plan_only:
+            with open(project_path + "/thingdata.json", "w", encoding="utf-8") as f:
+                f.write(json.dumps(thingdata, indent=4))
+
+    state = load_deploy_state(project_path, thingdata["thingiverse_id"])
+    for entry in entries:
+        if str(entry.get("thing")) != str(thingdata["thingiverse_id"]):
+            continue
+        if entry["op"] == "create":
+            state["metadata"] = entry["metadata"]
+        elif entry["op"] == "metadata":
+            state["metadata"] = dict(state.get("metadata", {}),
+                                     **entry["metadata"])
+        elif entry["op"] == "upload" and entry["kind"] == "/files":
+            state["files"][entry["name"]] = {"id":     entry["id"],
+                                             "sha256": entry["sha256"],
+                                             "size":   entry["size"]}
+        elif entry["op"] == "delete" and entry["kind"] == "/files":
+            thingiverse_record_deletion(state["files"], entry)
+    return state
+
+
+def thingiverse_plan_deploy(client, thingdata, modelfiles, imgfiles, state,
+                            scope=None):
+    """Works out everything a deploy would change, using only GET requests.
+
+    Returns the plan and the Thing as currently found on Thingiverse (None in
+    creation mode). The plan is a JSON serializable dict with:
+    - "mode": "create" or "patch"
+    - "metadata": the metadata fields that need to be sent
+    - "files" / "images": the changes from thingiverse_compare_files
+    - "image_ranks": rank changes of images that are kept on Thingiverse,
+      images uploaded by the plan are ranked after their upload
+    - "publish": whether the Thing gets published
+    """
+
     ########## Thing data
-    datapath = project_path + "/thingdata.json"
-    
-    headers = {"Authorization": "Bearer " + api_token}
-    
     # check if thing already exists, if id is provided
     if thingdata["thingiverse_id"] != "":
-        thing = json.loads(get("https://api.thingiverse.com/things/"
-                                + str(thingdata["thingiverse_id"]), 
-                                headers=headers).text)
-
-        # Check if we returned an error
-        if "error" in thing:
-            if thing["error"] == "Unauthorized":
-                logger.error("Unauthorized, is your API key correct? Exiting")
-                sys.exit(os.EX_NOPERM)
-            if thing["error"] == "Not Found":
-                logger.error("Thing ID specified but Thing not found, exiting")
-                sys.exit(os.EX_USAGE)
-
-        # compare provided name with found creator name as sanity check
-        if thingdata["thingiverse_creator"] == thing["creator"]["name"]:
-            mode = "patch"
-            logger.info("Thing already exists, running in patch mode")
-        else:
-            logger.error("""Thing ID specified in thingdata.json does not belong to 
-                        creator, exiting""")
+        thing_path = "/things/" + str(thingdata["thingiverse_id"])
+        thing = json.loads(client.get(thing_path).text)
+        thingiverse_check_thing(thingdata, thing)
+
+        existing_files  = json.loads(client.get(thing_path + "/files").text)
+        existing_images = json.loads(client.get(thing_path + "/images").text)
+    else:
+        thing = None
+        existing_files  = []
+        existing_images = []
+
+    plan = thingiverse_build_plan(thingdata, thing, existing_files,
+                                  existing_images, modelfiles, imgfiles, state,
+                                  scope)
+    return plan, thing
+
+
+def thingiverse_check_thing(thingdata, thing):
+    """Exits unless the Thing from thingdata.json can be patched"""
+    # Check if we returned an error
+    if "error" in thing:
+        if thing["error"] == "Unauthorized":
+            logger.error("Unauthorized, is your API key correct? Exiting")
             sys.exit(os.EX_NOPERM)
+        if thing["error"] == "Not Found":
+            logger.error("Thing ID specified but Thing not found, exiting")
+            sys.exit(os.EX_USAGE)
+
+    # compare provided name with found creator name as sanity check
+    if thingdata["thingiverse_creator"] != thing["creator"]["name"]:
+        logger.error("""Thing ID specified in thingdata.json does not belong to 
+                    creator, exiting""")
+        sys.exit(os.EX_NOPERM)
+
+
+def thingiverse_build_plan(thingdata, thing, existing_files, existing_images,
+                           modelfiles, imgfiles, state, scope=None):
+    """Builds the plan of thingiverse_plan_deploy from the fetched listings.
 
+    With a scope of changed file names, only those files are compared.
+    """
+    if thing is not None:
+        mode = "patch"
+        logger.info("Thing already exists, running in patch mode")
     else:
         mode = "create"
         logger.info("No thing ID provided, running in creation mode")
     logger.info("----------------------------------------")
 
+    ########## Remote files
+    if mode == "patch":
+        metadata = thingiverse_diff_metadata(thingdata, thing, state)
+        publish = (thingdata["thingiverse_is_published"]
+                   and not thing["is_published"])
+    else:
+        metadata = thingiverse_metadata(thingdata)
+        publish = bool(thingdata["thingiverse_is_published"])
+
+    image_scope = None
+    if scope is not None:
+        # Previews generated by Thingiverse change with their model file
+        image_scope = scope | set(os.path.splitext(name)[0] + ".png"
+                                  for name in scope)
+
+    logger.info("Checking model files:")
+    files = thingiverse_compare_files("/files", modelfiles, existing_files,
+                                      (), state["files"], scope)
+    logger.info("Checking images:")
+    images = thingiverse_compare_files("/images", imgfiles, existing_images,
+                                       modelfiles, state["files"], image_scope)
+
+    ########## Image order
+    deleted_images = set(image["id"] for image in images["delete"])
+    kept_images = [image for image in existing_images
+                   if image["id"] not in deleted_images]
+    image_ranks = thingiverse_rank_changes(kept_images)
+
+    plan = {"mode":           mode,
+            "thingiverse_id": thingdata["thingiverse_id"],
+            "metadata":       metadata,
+            "files":          files,
+            "images":         images,
+            "image_ranks":    image_ranks,
+            "publish":        publish}
+    return plan
+
+
+def thingiverse_write_plan(plan, project_path):
+    """Writes a plan to PLAN_FILE_NAME and outputs it"""
+    plan_json = json.dumps(plan, indent=4)
+    with open(project_path + "/" + PLAN_FILE_NAME, "w", encoding="utf-8") as f:
+        f.write(plan_json)
+    logger.info("Deploy plan written to %s:", PLAN_FILE_NAME)
+    logger.info(plan_json)
+
+
+def thingiverse_plan_is_empty(plan):
+    """Returns True if executing the plan would not change anything"""
+    if plan["mode"] != "patch":
+        return False
+    if plan["metadata"] or plan["image_ranks"] or plan["publish"]:
+        return False
+    return not thingiverse_plan_changes_files(plan)
+
+
+def thingiverse_plan_changes_files(plan):
+    """Returns True if the plan uploads or deletes any file or image"""
+    for kind in ("files", "images"):
+        for operation in ("upload", "replace", "delete"):
+            if plan[kind][operation]:
+                return True
+    return False
+
+
+def thingiverse_log_plan(plan):
+    """Outputs the upcoming operations of a plan"""
+    logger.info("----------------------------------------")
+    logger.info("Deploy plan (%s mode):", plan["mode"])
+
+    logger.info("Metadata to be sent:")
+    for field in plan["metadata"]:
+        logger.info(field)
+
+    for kind in ("files", "images"):
+        changes = plan[kind]
+        logger.info("%s to be uploaded:", kind.capitalize())
+        for file in changes["upload"]:
+            logger.info(file["name"])
+        logger.info("%s to be replaced:", kind.capitalize())
+        for pair in changes["replace"]:
+            logger.info(pair["local"]["name"])
+        logger.info("%s to be deleted:", kind.capitalize())
+        for file in changes["delete"]:
+            logger.info(file["name"])
+
+    logger.info("Images to be reranked:")
+    for image in plan["image_ranks"]:
+        logger.info("%s: %s -> %s", image["name"], image["from"], image["to"])
+
+    logger.info("Publishing: %s", "yes" if plan["publish"] else "no")
+    logger.info("----------------------------------------")
+
+
+def thingiverse_execute_plan(client, plan, thing, thingdata, project_path, state):
+    """Applies a plan from thingiverse_plan_deploy to Thingiverse"""
+    client.report.phase("metadata")
+    thingiverse_apply_metadata(client, plan, thing, thingdata, project_path, state)
+
+    # Model file upload
+    try:
+        logger.info("----------------------------------------")
+        logger.info("Deploying model files:")
+        thingiverse_deploy_files("/files", plan["files"], thingdata, client, state)
+
+        # Image upload
+        logger.info("----------------------------------------")
+        logger.info("Deploying images:")
+        thingiverse_deploy_files("/images", plan["images"], thingdata, client)
+    finally:
+        save_deploy_state(project_path, state)
+
+    thingiverse_finish_plan(client, plan, thingdata, project_path)
+
+
+def thingiverse_apply_metadata(client, plan, thing, thingdata, project_path, state):
+    """Creates the Thing or patches its metadata, as planned. Returns the Thing"""
     ########## Thing creation
     # If ID wasn't already found, first create thing
-    if mode == "create":
+    if plan["mode"] == "create":
 
         logger.info("")
         logger.info("Creating thing")
 
         # initial file creation
-        params = {"name":           thingdata["name"],
-                  "license":        thingdata["thingiverse_license"],
-                  "category":       thingdata["thingiverse_category"],
-                  "description":    thingdata["thingiverse_description"],
-                  "instructions":   thingdata["thingiverse_instructions"],
-                  "is_wip":         thingdata["thingiverse_is_wip"],
-                  "tags":           thingdata["tags"]}
+        params = plan["metadata"]
 
         request_content = json.dumps(params)
-        response = requests.post("https://api.thingiverse.com/things/", headers=headers, data=request_content)
+        response = client.post("/things/", data=request_content)
 
         thing = json.loads(response.text)
+        client.journal_operation("create", thing=thing["id"], metadata=params)
+        thingiverse_record_creation(thing, params, thingdata, project_path, state)
+        return thing
 
-        # Output response to file for debugging
-        with open(project_path + "/CreationResponse.json", "w") as f:
-            f.write(json.dumps(thing, indent=4))
+    ########## Thing info patching
+    # Otherwise, go into patching mode
+    if thingiverse_plan_is_empty(plan):
+        logger.info("Thing is up to date, nothing to deploy")
 
-        new_thing_id = thing["id"]
+    return thingiverse_patch_thing(client, plan, thing, thingdata, project_path,
+                                   state)
 
-        # check if valid answer received
-        if new_thing_id != "":
-            logger.info("Thing creation succesful, thing ID: %s", new_thing_id)
-        
-        # Update flags document with newly created ID
-        thingdata["thingiverse_id"] = new_thing_id
-        with open(datapath, "w", encoding="utf-8") as f:
-            f.write(json.dumps(thingdata, indent=4))
 
-        # Output initial creation file for pipeline
-        with open(project_path + "/InitialCreation", "w") as f:
-            logger.info("InitialCreation file generated")
-            f.write("Initial creation success")
+def thingiverse_finish_plan(client, plan, thingdata, project_path):
+    """Ranks images and publishes the Thing once all files are transferred"""
+    # Uploads add images (including previews generated by Thingiverse), so
+    # the order can only be known from a fresh listing
+    client.report.phase("ranking")
+    if thingiverse_plan_changes_files(plan):
+        thingiverse_set_image_order(thingdata, client)
+    elif plan["image_ranks"]:
+        logger.info("Ranking images based on file names")
+        thingiverse_rank_images(thingdata, client, plan["image_ranks"])
 
+    # Publishing
+    client.report.phase("publish")
+    thingiverse_log_publish(plan, thingdata)
+    if plan["publish"]:
+        thingiverse_publish_project(thingdata, client)
 
-    ########## Thing info patching  
-    # Otherwise, go into patching mode
-    elif mode == "patch":
-        
-        logger.info("Patching thing")
-
-        params = {"name":           thingdata["name"],
-                  "license":        thingdata["thingiverse_license"],
-                  "category":       thingdata["thingiverse_category"],
-                  "description":    thingdata["thingiverse_description"],
-                  "instructions":   thingdata["thingiverse_instructions"],
-                  "is_wip":         thingdata["thingiverse_is_wip"],
-                  "tags":           thingdata["tags"]}
-
-        patch("https://api.thingiverse.com/things/"
-                                    + str(thingdata["thingiverse_id"])
-                                    + "/", headers=headers,
-                                    data=json.dumps(params))
+    thingiverse_write_artifacts(thingdata, project_path)
 
-        # wait a tick before pulling an answer
-        # since Thingiverse does not populate all answers instantly
-        logger.info("Waiting for Thingiverse to refresh tags in response")
-        time.sleep(2) 
 
-        thing = json.loads(get("https://api.thingiverse.com/things/"
-                                    + str(thingdata["thingiverse_id"])
-                                    + "/", headers=headers).text)
+def thingiverse_record_creation(thing, params, thingdata, project_path, state):
+    """Stores the ID of a newly created Thing in thingdata.json and the state"""
+    # Output response to file for debugging
+    with open(project_path + "/CreationResponse.json", "w") as f:
+        f.write(json.dumps(thing, indent=4))
 
-        already_published = thing["is_published"]
+    new_thing_id = thing["id"]
 
-        # Output response to file for debugging, loads/dumps formats document
-        with open(project_path + "/PatchResponse.json", "w") as f:
-                f.write(json.dumps(thing, indent=4))
+    # check if valid answer received
+    if new_thing_id != "":
+        logger.info("Thing creation succesful, thing ID: %s", new_thing_id)
+    
+    # Update flags document with newly created ID
+    thingdata["thingiverse_id"] = new_thing_id
+    with open(project_path + "/thingdata.json", "w", encoding="utf-8") as f:
+        f.write(json.dumps(thingdata, indent=4))
+
+    # Output initial creation file for pipeline
+    with open(project_path + "/InitialCreation", "w") as f:
+        logger.info("InitialCreation file generated")
+        f.write("Initial creation success")
+
+    state["thingiverse_id"] = new_thing_id
+    state["metadata"] = params
+
+
+def thingiverse_patch_thing(client, plan, thing, thingdata, project_path, state):
+    """Sends the planned metadata of an existing Thing and waits for it to show.
+
+    Only the fields that differ are sent. Without any, neither the patch nor
+    the wait for Thingiverse to refresh is needed.
+    """
+    if plan["metadata"]:
+        logger.info("Patching thing: %s", ", ".join(sorted(plan["metadata"])))
+
+        params = plan["metadata"]
+
+        response = client.patch("/things/"
+                                    + str(thingdata["thingiverse_id"])
+                                    + "/",
+                                    data=json.dumps(params))
+        try:
+            patched = json.loads(response.text)
+        except ValueError:
+            patched = None
+
+        # Thingiverse does not populate all answers instantly, so unless the
+        # patch answer already shows the patched fields, poll until they do
+        if (isinstance(patched, dict) and "id" in patched
+                and thingiverse_metadata_reflected(patched, params)):
+            thing = patched
+        else:
+            logger.info("Waiting for Thingiverse to refresh tags in response")
+            thing, refreshed = wait_for(
+                lambda: json.loads(client.get("/things/"
+                                        + str(thingdata["thingiverse_id"])
+                                        + "/").text),
+                lambda thing: thingiverse_metadata_reflected(thing, params),
+                THINGIVERSE_REFRESH_TIMEOUT)
+            if not refreshed:
+                logger.warning("Thingiverse did not reflect the patch within %s seconds",
+                               THINGIVERSE_REFRESH_TIMEOUT)
+        client.journal_operation("metadata", thing=thingdata["thingiverse_id"],
+                                 metadata=params)
 
         # Check if valid answer received
         if thing["id"] == thingdata["thingiverse_id"]:
             logger.info("Thing patching succesful")
-    
-        # Remove InitialCreation file on repeat runs
-        if os.path.exists(project_path + "/InitialCreation"):
-            os.remove(project_path + "/InitialCreation")
-            logger.info("InitialCreation file removed")
 
+        state["metadata"] = dict(state.get("metadata", {}), **params)
+    else:
+        logger.info("Thing metadata is up to date")
 
-    # Model file upload
-    logger.info("----------------------------------------")
-    logger.info("Deploying model files:")
-    thingiverse_deploy_files("/files", modelfiles, "whitelist", thingdata, headers)
+    # Output response to file for debugging, loads/dumps formats document
+    with open(project_path + "/PatchResponse.json", "w") as f:
+            f.write(json.dumps(thing, indent=4))
 
-    # Image upload
-    logger.info("----------------------------------------")
-    logger.info("Deploying images:")
-    thingiverse_deploy_files("/images", imgfiles, modelfiles, thingdata, headers)
-    thingiverse_set_image_order(imgfiles, thingdata, headers)
+    # Remove InitialCreation file on repeat runs
+    if os.path.exists(project_path + "/InitialCreation"):
+        os.remove(project_path + "/InitialCreation")
+        logger.info("InitialCreation file removed")
 
-    # Publishing
+    return thing
+
+
+def thingiverse_log_publish(plan, thingdata):
+    """Outputs whether the Thing is about to be published"""
     logger.info("----------------------------------------")
     logger.info("Testing if publishing is required")
-    if thingdata["thingiverse_is_published"] and not thing["is_published"]:
+    if plan["publish"]:
         logger.info("Publishing thing")
-        thingiverse_publish_project(thingdata, headers)
 
     elif not thingdata["thingiverse_is_published"]:
         logger.info("Publishing not requested")
 
-    elif thing["is_published"]:
+    else:
         logger.info("Thing already published")
 
 
-    # Output thing URL to artifact and terminal
+def thingiverse_write_artifacts(thingdata, project_path):
+    """Outputs thing URL and ID to artifacts and terminal"""
     thing_url = "https://thingiverse.com/thing:" + str(thingdata["thingiverse_id"])
     logger.info("----------------------------------------")
     logger.info("Deploying done! Thing URL: ")
@@ -667,33 +3245,452 @@ def deploy_thingiverse(api_token, thingdata, project_path, modelfiles, imgfiles)
         f.write(str(thingdata["thingiverse_id"]))
 
 
+########## Thingiverse, asyncio
+async def thingiverse_deploy_async(client, thingdata, project_path, modelfiles,
+                                   imgfiles, state, plan_only=False, scope=None):
+    """Plans and executes a deployment on one event loop.
+
+    Fetching the Thing and its listings, the metadata patch, deletions,
+    uploads and rank updates are issued concurrently where they do not
+    depend on each other.
+    """
+    async with AsyncThingiverseClient(client) as aclient:
+        plan, thing = await thingiverse_plan_deploy_async(
+                             aclient, thingdata, modelfiles, imgfiles, state,
+                             scope)
+        thingiverse_log_plan(plan)
+
+        if plan_only:
+            thingiverse_write_plan(plan, project_path)
+            return plan
+
+        await thingiverse_execute_plan_async(aclient, plan, thing, thingdata,
+                                             project_path, state)
+        return plan
+
+
+async def gather_all(*awaitables):
+    """Like asyncio.gather, but lets every awaitable finish before raising"""
+    import asyncio
+
+    results = await asyncio.gather(*awaitables, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+async def thingiverse_plan_deploy_async(aclient, thingdata, modelfiles, imgfiles,
+                                        state, scope=None):
+    """Async thingiverse_plan_deploy, listing files and images alongside the Thing"""
+    if thingdata["thingiverse_id"] != "":
+        thing_path = "/things/" + str(thingdata["thingiverse_id"])
+        thing, existing_files, existing_images = await gather_all(
+                                    aclient.get_json(thing_path),
+                                    aclient.get_json(thing_path + "/files"),
+                                    aclient.get_json(thing_path + "/images"))
+        thingiverse_check_thing(thingdata, thing)
+    else:
+        thing = None
+        existing_files  = []
+        existing_images = []
+
+    plan = thingiverse_build_plan(thingdata, thing, existing_files,
+                                  existing_images, modelfiles, imgfiles, state,
+                                  scope)
+    return plan, thing
+
+
+async def thingiverse_execute_plan_async(aclient, plan, thing, thingdata,
+                                         project_path, state):
+    """Async thingiverse_execute_plan.
+
+    Only the file transfers are fanned out on the event loop. In patch mode
+    the metadata patch overlaps with them, as they do not depend on it. Log
+    output of the transfers is replayed in plan order once all of them are
+    done. Creation, ranking and publishing run the synchronous steps on a
+    worker thread.
+    """
+    client = aclient.client
+
+    metadata = aclient.run(thingiverse_apply_metadata, client, plan, thing,
+                           thingdata, project_path, state)
+    if plan["mode"] == "create":
+        # Transfers need the ID of the new Thing
+        client.report.phase("metadata")
+        await metadata
+        transfers = []
+    else:
+        # The patch waits for Thingiverse to refresh, so it gets a worker
+        # thread of its own for the whole time
+        transfers = [metadata]
+
+    client.report.phase("transfer")
+    try:
+        transfers += [
+            thingiverse_deploy_files_async(aclient, "/files", plan["files"],
+                                           thingdata, state),
+            thingiverse_deploy_files_async(aclient, "/images", plan["images"],
+                                           thingdata)]
+        results = await gather_all(*transfers)
+    finally:
+        save_deploy_state(project_path, state)
+
+    for kind, (deleted, uploaded) in zip(("model files", "images"), results[-2:]):
+        logger.info("----------------------------------------")
+        logger.info("Deploying %s:", kind)
+        for file in deleted:
+            logger.info("Deleted %s", file["name"])
+        for file, log_records in uploaded:
+            log_upload_records(file, log_records)
+
+    await aclient.run(thingiverse_finish_plan, client, plan, thingdata,
+                      project_path)
+
+
+async def thingiverse_deploy_files_async(aclient, access_path, changes,
+                                         thingdata, state=None):
+    """Async thingiverse_deploy_files, starting all uploads and deletions at once.
+
+    As in the synchronous version, a replaced file is deleted right after
+    its replacement is finalized. Returns the deleted files and the uploaded
+    files with their log records, both in plan order.
+    """
+    if state is None:
+        state = {"files": {}}
+    deployed = state["files"]
+
+    files_to_delete, files_to_upload = thingiverse_file_operations(
+                                        access_path, changes, deployed)
+
+    async def delete(file):
+        await aclient.run_api(thingiverse_delete_file, access_path, file,
+                              thingdata, aclient.client)
+        thingiverse_record_deletion(deployed, file)
+        return file
+
+    async def upload(file, replaced):
+        finalize_response, log_records = await aclient.upload_file(file, thingdata)
+        thingiverse_journal_upload(aclient.client, access_path, file, replaced,
+                                   finalize_response, thingdata)
+        if replaced is not None:
+            log_records.append((logging.INFO, "Deleting replaced version of %s",
+                                (replaced["name"],)))
+            await delete(replaced)
+        if access_path == "/files":
+            thingiverse_record_upload(deployed, file, finalize_response)
+        return file, log_records
+
+    results = await gather_all(*(upload(*operation) for operation in files_to_upload),
+                               *map(delete, files_to_delete))
+    return results[len(files_to_upload):], results[:len(files_to_upload)]
+
+
 ##########################################################################
-##                             main()                                   ##
+##                             Watch mode                               ##
 ##########################################################################
-def main():
+class InotifyWatcher:
+    """Reports changed project files using Linux inotify, through ctypes.
+
+    Watches the project folder and the folders of PROJECT_FILE_TYPES with
+    all their subfolders, including folders created later. Raises OSError
+    where inotify is not available.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM  = 0x00000040
+    IN_MOVED_TO    = 0x00000080
+    IN_CREATE      = 0x00000100
+    IN_DELETE      = 0x00000200
+    IN_Q_OVERFLOW  = 0x00004000
+    IN_IGNORED     = 0x00008000
+    IN_ISDIR       = 0x40000000
+    IN_NONBLOCK    = 0o4000
+    IN_CLOEXEC     = 0o2000000
+
+    # Files are reported once written, not on every write of an export
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, project_path):
+        import ctypes
+        import ctypes.util
+
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._ctypes = ctypes
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                                 use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("libc does not provide inotify")
+
+        self.project_path = project_path
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            self._raise_errno()
+        # Watch descriptor: folder relative to the project, "" for its root
+        self._watches = {}
+        self.watch_tree("")
+
+    def _raise_errno(self):
+        errno = self._ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    def watch_tree(self, relpath):
+        """Watches a folder and its subfolders, returns the files in them"""
+        files = []
+        for folder, folders, names in os.walk(os.path.join(self.project_path,
+                                                           relpath)):
+            folder_relpath = os.path.relpath(folder, self.project_path)
+            folder_relpath = "" if folder_relpath == "." else \
+                             folder_relpath.replace(os.sep, "/")
+            # Below the project root only the project file folders matter
+            folders[:] = [name for name in folders
+                          if not name.startswith(".")
+                          and (folder_relpath or name in PROJECT_FILE_TYPES)]
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder),
+                                              self.MASK)
+            if wd < 0:
+                self._raise_errno()
+            self._watches[wd] = folder_relpath
+            files.extend(folder_relpath + "/" + name if folder_relpath else name
+                         for name in names)
+        return files
+
+    def read(self, timeout):
+        """Waits up to timeout seconds, or forever if None, for project files
+        to change.
+
+        Returns the changed project files, an empty set if there were none
+        and None if they are not known, e.g. when events were dropped.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = None
+            if deadline is not None:
+                delay = max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self._fd], [], [], delay)
+            changes = self.read_events() if ready else set()
+            if changes is None or changes \
+                    or (deadline is not None and time.monotonic() >= deadline):
+                return changes
+
+    def read_events(self):
+        """Returns the project files changed by the pending events"""
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changes = set()
+        unknown = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & self.IN_Q_OVERFLOW:
+                unknown = True
+                continue
+            if mask & self.IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            folder = self._watches.get(wd)
+            if folder is None:
+                continue
+            relpath = folder + "/" + name if folder else name
+
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    if folder or name in PROJECT_FILE_TYPES:
+                        try:
+                            changes.update(self.watch_tree(relpath))
+                        except OSError:
+                            # Gone again before it could be watched
+                            pass
+                elif mask & self.IN_MOVED_FROM:
+                    # The files moved away with it are not reported
+                    unknown = True
+                continue
+            # The contents of a new file follow with IN_CLOSE_WRITE
+            if mask & self.IN_CREATE:
+                continue
+            changes.add(relpath)
+
+        if unknown:
+            return None
+        return set(filter(is_project_path, changes))
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Reports changed project files by comparing the size, modification
+    time and inode of every file each WATCH_POLL_INTERVAL seconds"""
+
+    def __init__(self, project_path):
+        self.project_path = project_path
+        self._snapshot = self.snapshot()
+
+    def snapshot(self):
+        files = {}
+        for folder in [""] + list(PROJECT_FILE_TYPES):
+            for path, folders, names in os.walk(os.path.join(self.project_path,
+                                                             folder)):
+                folders[:] = [name for name in folders if folder
+                              and not name.startswith(".")]
+                relpath = os.path.relpath(path, self.project_path)
+                for name in names:
+                    file_relpath = name if relpath == "." else \
+                                   relpath.replace(os.sep, "/") + "/" + name
+                    if not is_project_path(file_relpath):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(path, name))
+                    except OSError:
+                        continue
+                    files[file_relpath] = (stat.st_size, stat.st_mtime_ns,
+                                           stat.st_ino)
+        return files
+
+    def read(self, timeout):
+        """Polls for up to timeout seconds, or until files changed if None.
+
+        Returns the changed project files, an empty set if there were none.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = WATCH_POLL_INTERVAL
+            if deadline is not None:
+                delay = max(0.0, min(delay, deadline - time.monotonic()))
+            time.sleep(delay)
+            snapshot = self.snapshot()
+            changes = set(relpath for relpath in set(snapshot) | set(self._snapshot)
+                          if snapshot.get(relpath) != self._snapshot.get(relpath))
+            self._snapshot = snapshot
+            if changes or (deadline is not None and time.monotonic() >= deadline):
+                return changes
+
+    def close(self):
+        pass
+
+
+def open_project_watcher(project_path):
+    """Returns an InotifyWatcher for a project, or a PollingWatcher where
+    inotify is not available"""
+    try:
+        return InotifyWatcher(project_path)
+    except OSError as e:
+        logger.info("inotify not available (%s), scanning for changes every "
+                    "%s seconds", e, WATCH_POLL_INTERVAL)
+        return PollingWatcher(project_path)
+
+
+def wait_for_project_changes(watcher):
+    """Blocks until project files change and then until they did not change
+    for WATCH_DEBOUNCE seconds, so saving several files or a slow export
+    deploys once.
+
+    Returns the changed paths, None if they are not known and the whole
+    project has to be compared.
+    """
+    changes = set()
+    while changes is not None and not changes:
+        changes = watcher.read(None)
+    while True:
+        more = watcher.read(WATCH_DEBOUNCE)
+        if more is not None and not more:
+            return changes
+        if changes is None or more is None:
+            changes = None
+        else:
+            changes |= more
 
-    ##########################################################################
-    ##                            Logging                                   ##
-    ##########################################################################
+
+def watch_project(project_path, backends):
+    """Deploys a project, then redeploys whatever changes until interrupted.
+
+    The backends stay open in between, so the API client keeps its
+    connections, rate limits and response cache. Only changed files are
+    compared and transferred, and a change to thingdata.json or README.md
+    only patches the metadata that differs. The changes of a failed round
+    are deployed again with the next one.
+    """
+    # Watching starts first, so edits during the first deployment count
+    watcher = open_project_watcher(project_path)
+    try:
+        with ExitStack() as stack:
+            for backend in backends:
+                stack.enter_context(backend)
+            changes = None
+            while True:
+                if changes is not None:
+                    logger.info("Changed: %s", ", ".join(sorted(changes)))
+                failed = False
+                try:
+                    summary = deploy_project_destinations(project_path, backends,
+                                                          changes=changes)
+                    failed = any(outcome["status"] != "ok" for outcome in summary)
+                except SystemExit as e:
+                    if e.code not in (None, os.EX_OK):
+                        logger.error("Deployment failed with exit code %s",
+                                     e.code)
+                        failed = True
+                except Exception:
+                    logger.exception("Deployment failed")
+                    failed = True
+                logger.info("Watching %s for changes, Ctrl+C to stop",
+                            project_path)
+                more = wait_for_project_changes(watcher)
+                if not failed:
+                    changes = more
+                elif changes is None or more is None:
+                    changes = None
+                else:
+                    changes = changes | more
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+    finally:
+        watcher.close()
+
+
+##########################################################################
+##                             main()                                   ##
+##########################################################################
+def configure_logging():
+    """Applies LOGGING_CONFIG_NAME from the working directory if present,
+    otherwise logs to stdout. yaml is only imported if there is a file."""
+    if not os.path.isfile(LOGGING_CONFIG_NAME):
+        logging.basicConfig(stream=sys.stdout, format=LOGGING_DEFAULT_FORMAT, level=logging.INFO, force=True)
+        logger.info("No logging config (%s) found. Using default settings!", LOGGING_CONFIG_NAME)
+        return
 
     try:
+        from logging.config import dictConfig
+        import yaml
+
         with open(LOGGING_CONFIG_NAME, 'r') as f:
             d = yaml.safe_load(f)
-            logging.config.dictConfig(d)
+            dictConfig(d)
         logger.info("Logging config loaded from file: %s", LOGGING_CONFIG_NAME)
-    except FileNotFoundError:
+    except (OSError, ValueError, TypeError, AttributeError, ImportError) as e:
         logging.basicConfig(stream=sys.stdout, format=LOGGING_DEFAULT_FORMAT, level=logging.INFO, force=True)
-        logger.info("No logging config (%s) found. Using default settings!", LOGGING_CONFIG_NAME)
-    except (ValueError, TypeError, AttributeError, ImportError) as e:
         logger.error("Error reading logging config (%s):", LOGGING_CONFIG_NAME)
         logger.error(e)
         logger.error("Exiting...")
         sys.exit(os.EX_CONFIG)
 
-    logger.info("")
-    logger.info("----------------------------------------")
-    logger.info("----------- Threedeploy start ----------")
-    logger.info("----------------------------------------")
+
+def main():
+    global THINGIVERSE_UPLOAD_WORKERS, THINGIVERSE_RATE_LIMIT, BATCH_WORKERS
+    global REPORT_SUMMARY, THINGIVERSE_ASYNCIO, THINGIVERSE_RESPONSE_CACHE
+    global OPTIMIZE_MODELS, BUNDLE_SMALL_FILES, OPTIMIZE_IMAGES, IMAGE_MAX_SIZE
+    global THINGIVERSE_API_URL, THINGIVERSE_UPLOAD_URL, GIT_INCREMENTAL
+    global FINGERPRINT_CACHE, THINGIVERSE_CONNECT_TIMEOUT, THINGIVERSE_READ_TIMEOUT
 
     ##########################################################################
     ##                            Arguments                                 ##
@@ -708,6 +3705,19 @@ def main():
                         default=None,
                         help="Use a custom client ID")
 
+    # Custom endpoints, e.g. of python -m threedeploy.mockserver
+    parser.add_argument("--api-url",
+                        type=str,
+                        default=THINGIVERSE_API_URL,
+                        help="Thingiverse API to deploy to. Default: "
+                             + THINGIVERSE_API_URL)
+
+    parser.add_argument("--upload-url",
+                        type=str,
+                        default=THINGIVERSE_UPLOAD_URL,
+                        help="Thingiverse upload storage. Default: "
+                             + THINGIVERSE_UPLOAD_URL)
+
     # Project path
     parser.add_argument("--path", metavar="path", type=str,
                         help=
@@ -736,14 +3746,217 @@ def main():
     "Deploy to Thingiverse if set. "
     "Input Thingiverse API token, generated with --request-token-thingiverse")
 
+    # Mirror to a local folder, alone or next to other destinations
+    parser.add_argument("--deploy-project-directory",
+                        metavar="path",
+                        type=str,
+                        help=
+    "Deploy to a local folder if set, copying the project into a subfolder "
+    "named like it. Given with other destinations, the project is scanned "
+    "once and deployed to all of them at the same time")
+
+    # Deploy many projects at once
+    parser.add_argument("--batch",
+                        metavar="path",
+                        nargs="+",
+                        help=
+    "Deploy every project found at the given paths or glob patterns at "
+    "once, instead of --path. Folders without thingdata.json are searched "
+    "one level down")
+
+    # Number of projects deployed at the same time
+    parser.add_argument("--batch-workers",
+                        metavar="count",
+                        type=int,
+                        default=BATCH_WORKERS,
+                        help=
+    "Number of projects deployed at the same time with --batch "
+    "(default: %(default)s)")
+
+    # Batch summary output
+    parser.add_argument("--batch-summary",
+                        metavar="file",
+                        type=str,
+                        help=
+    "Write the outcome of every project deployed with --batch to this "
+    "JSON file")
+
+    # Only deploy what git reports as changed
+    parser.add_argument("--since-deployed-commit",
+                        action="store_true",
+                        help=
+    "Record the deployed git commit in " + DEPLOYED_COMMIT_FILE_NAME + ", and "
+    "on the next run only deploy the files git reports as changed since. "
+    "Stops right away if none changed")
+
+    # Keep deploying changes
+    parser.add_argument("--watch",
+                        action="store_true",
+                        help=
+    "Keep running after deploying the project and redeploy the files that "
+    "change, once they did not change for " + str(WATCH_DEBOUNCE) + " "
+    "seconds. Uses inotify on Linux and scans the project elsewhere")
+
+    # Only compute the changes a deployment would make
+    parser.add_argument("--plan",
+                        action="store_true",
+                        help=
+    "Only compute what deploying would change and write it to "
+    + PLAN_FILE_NAME + ", without modifying anything")
+
+    # Timing summary
+    parser.add_argument("--report-summary",
+                        action="store_true",
+                        help=
+    "Log a table of phase and request timings at the end of a deployment. "
+    "The full timings are always written to " + REPORT_FILE_NAME)
+
+    # Response cache location
+    parser.add_argument("--response-cache",
+                        type=str,
+                        default=THINGIVERSE_RESPONSE_CACHE,
+                        help=
+    "File caching Thingiverse GET responses between runs, unchanged responses "
+    "are then revalidated instead of downloaded. Pass an empty string to "
+    "disable the cache. Default: " + THINGIVERSE_RESPONSE_CACHE)
+
+    # Fingerprint cache location
+    parser.add_argument("--fingerprint-cache",
+                        type=str,
+                        default=FINGERPRINT_CACHE,
+                        help=
+    "File caching the SHA-256 of project files between runs, files whose "
+    "size, inode and modification time are unchanged are not read again. "
+    "Pass an empty string to disable the cache. Default: " + FINGERPRINT_CACHE)
+
+    # Pre-upload optimization
+    parser.add_argument("--optimize-models",
+                        action="store_true",
+                        help=
+    "Convert ASCII STL files to the much smaller binary STL before uploading "
+    "them. Requires NumPy")
+
+    parser.add_argument("--bundle-small-files",
+                        action="store_true",
+                        help=
+    "Upload the source and gcode files of up to %d KiB as a single %s"
+    % (BUNDLE_MAX_FILE_SIZE // 1024, BUNDLE_FILE_NAME))
+
+    parser.add_argument("--optimize-images",
+                        action="store_true",
+                        help=
+    "Downscale images to --image-max-size, convert BMP to PNG and strip "
+    "metadata before uploading them. Requires Pillow")
+
+    parser.add_argument("--image-max-size",
+                        type=int,
+                        default=IMAGE_MAX_SIZE,
+                        help=
+    "Longest image side in pixels for --optimize-images. Default: %d"
+    % IMAGE_MAX_SIZE)
+
+    # Asyncio deployment
+    parser.add_argument("--asyncio",
+                        action="store_true",
+                        help=
+    "Deploy to Thingiverse on an asyncio event loop, overlapping listings, "
+    "the metadata patch, deletions and uploads. Images are ranked once the "
+    "transfers are done")
+
+    # Number of concurrent file transfers
+    parser.add_argument("--upload-workers",
+                        metavar="count",
+                        type=int,
+                        default=THINGIVERSE_UPLOAD_WORKERS,
+                        help=
+    "Number of files uploaded at the same time (default: %(default)s)")
+
+    # Requests per second sent to the Thingiverse API
+    parser.add_argument("--rate-limit",
+                        metavar="requests_per_second",
+                        type=float,
+                        default=THINGIVERSE_RATE_LIMIT,
+                        help=
+    "Maximum Thingiverse API requests per second, 0 disables the limit "
+    "(default: %(default)s)")
+
+    # Request timeouts
+    parser.add_argument("--connect-timeout",
+                        metavar="seconds",
+                        type=float,
+                        default=THINGIVERSE_CONNECT_TIMEOUT,
+                        help=
+    "Seconds to wait for a connection to Thingiverse before retrying "
+    "(default: %(default)s)")
+    parser.add_argument("--read-timeout",
+                        metavar="seconds",
+                        type=float,
+                        default=THINGIVERSE_READ_TIMEOUT,
+                        help=
+    "Seconds to wait for Thingiverse to send data on an open connection "
+    "before retrying (default: %(default)s)")
+
     args = parser.parse_args()
 
+    ##########################################################################
+    ##                            Logging                                   ##
+    ##########################################################################
+
+    # Configured after parsing, so --help and usage errors never read it
+    configure_logging()
+
+    logger.info("")
+    logger.info("----------------------------------------")
+    logger.info("----------- Threedeploy start ----------")
+    logger.info("----------------------------------------")
+
     # Override thingiverse client id if custom one is provided
     if args.client_id_thingiverse:
         global THINGIVERSE_CLIENT_ID
         logger.info(f"Using custom client id for thingiverse: %s", args.client_id_thingiverse)
         THINGIVERSE_CLIENT_ID = args.client_id_thingiverse
 
+    # Override number of concurrent uploads
+    if args.upload_workers < 1:
+        logger.info("--upload-workers must be at least 1, exiting")
+        sys.exit(os.EX_USAGE)
+    THINGIVERSE_UPLOAD_WORKERS = args.upload_workers
+
+    # Override API rate limit
+    if args.rate_limit < 0:
+        logger.info("--rate-limit must not be negative, exiting")
+        sys.exit(os.EX_USAGE)
+    THINGIVERSE_RATE_LIMIT = args.rate_limit
+
+    # Override request timeouts
+    if args.connect_timeout <= 0 or args.read_timeout <= 0:
+        logger.info("--connect-timeout and --read-timeout must be positive, exiting")
+        sys.exit(os.EX_USAGE)
+    THINGIVERSE_CONNECT_TIMEOUT = args.connect_timeout
+    THINGIVERSE_READ_TIMEOUT = args.read_timeout
+
+    # Override number of concurrently deployed projects
+    if args.batch_workers < 1:
+        logger.info("--batch-workers must be at least 1, exiting")
+        sys.exit(os.EX_USAGE)
+    BATCH_WORKERS = args.batch_workers
+
+    REPORT_SUMMARY = args.report_summary
+    THINGIVERSE_ASYNCIO = args.asyncio
+    THINGIVERSE_RESPONSE_CACHE = args.response_cache
+    FINGERPRINT_CACHE = args.fingerprint_cache
+    THINGIVERSE_API_URL = args.api_url.rstrip("/")
+    THINGIVERSE_UPLOAD_URL = args.upload_url
+    OPTIMIZE_MODELS = args.optimize_models
+    BUNDLE_SMALL_FILES = args.bundle_small_files
+    OPTIMIZE_IMAGES = args.optimize_images
+    GIT_INCREMENTAL = args.since_deployed_commit
+
+    if args.image_max_size < 1:
+        logger.info("--image-max-size must be at least 1, exiting")
+        sys.exit(os.EX_USAGE)
+    IMAGE_MAX_SIZE = args.image_max_size
+
     ##########################################################################
     ##                              Modes                                   ##
     ##########################################################################
@@ -764,8 +3977,32 @@ def main():
     elif args.request_token_thingiverse:
         thingiverse_request_token()
 
+    ########## batch deployment
+    elif args.batch:
+        if args.watch:
+            logger.info("--watch only deploys a single project, exiting")
+            sys.exit(os.EX_USAGE)
+        if not args.deploy_project_thingiverse or args.deploy_project_directory:
+            logger.info("--batch only deploys to Thingiverse, exiting")
+            sys.exit(os.EX_USAGE)
+
+        project_paths = find_projects(args.batch)
+        if not project_paths:
+            logger.info("No projects found at the paths specified, exiting")
+            sys.exit(os.EX_USAGE)
+
+        summary = deploy_batch(project_paths, args.deploy_project_thingiverse,
+                               'thingiverse', args.plan)
+
+        if args.batch_summary:
+            with open(args.batch_summary, "w", encoding="utf-8") as f:
+                f.write(json.dumps(summary, indent=4))
+
+        if any(outcome["status"] != "ok" for outcome in summary):
+            sys.exit(os.EX_UNAVAILABLE)
+
     ########## project deployment
-    elif args.deploy_project_thingiverse:
+    elif args.deploy_project_thingiverse or args.deploy_project_directory:
         # or myminifactory
         # or prusaprinters
         # or thangs
@@ -777,10 +4014,36 @@ def main():
         if not os.path.isdir(args.path):
             logger.info("The path specified does not exist, exiting")
             sys.exit(os.EX_USAGE)
+        if args.watch and args.plan:
+            logger.info("--watch deploys changes, it can't be used with --plan")
+            sys.exit(os.EX_USAGE)
 
-        # call deployment function, passing destination input
+        backends = []
         if args.deploy_project_thingiverse:
-            deploy_project(args.path, args.deploy_project_thingiverse, 'thingiverse')
+            backends.append(ThingiverseBackend(args.deploy_project_thingiverse))
+        if args.deploy_project_directory:
+            backends.append(DirectoryBackend(args.deploy_project_directory))
+
+        from requests import RequestException
+
+        # call deployment function, passing destination input
+        try:
+            if args.watch:
+                watch_project(args.path, backends)
+            elif len(backends) > 1:
+                summary = deploy_project_destinations(args.path, backends,
+                                                      args.plan)
+                if any(outcome["status"] != "ok" for outcome in summary):
+                    sys.exit(os.EX_UNAVAILABLE)
+            elif args.deploy_project_thingiverse:
+                deploy_project(args.path, args.deploy_project_thingiverse,
+                               'thingiverse', args.plan)
+            else:
+                deploy_project(args.path, args.deploy_project_directory,
+                               'directory', args.plan)
+        except (RequestException, OSError) as e:
+            logger.error("Deployment failed: %s", e)
+            sys.exit(os.EX_UNAVAILABLE)
         # elif myminifactory
         #    deploy_project(args.path, args.deploy-project-thingiverse, 'myminifactory')
         # elif prusaprinters